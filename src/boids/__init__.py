@@ -1 +1,4 @@
 from .cli import run as run
+from .model import Flock as Flock
+from .model import Weights as Weights
+from .simulate import simulate as simulate
@@ -1,67 +1,124 @@
+import queue
+import threading
+import time
+from collections.abc import Callable
+
 from matplotlib.animation import FuncAnimation
 from matplotlib.widgets import Button, Slider
 import matplotlib.pyplot as plt
+import numpy as np
+from boids.export import display_stride
 from boids.model import Flock
+from boids.pacing import AdaptivePacer
+from boids.profiling import FrameStats
+from boids.recording import Trajectory
+from boids.worker import SimulationWorker
+
+
+class FrameTimedAnimation(FuncAnimation):
+    """FuncAnimation which reports how long each frame took to update and draw.
+
+    A frame starts when func is called, and ends once the animation's timer has run
+    its callbacks, the first of which (added by FuncAnimation) draws the frame. Only
+    public hooks are used, so this does not depend on matplotlib's internals.
+    """
+
+    def __init__(
+        self,
+        fig: plt.Figure,
+        func: Callable,
+        *args,
+        on_frame: Callable[[float], None],
+        **kwargs,
+    ):
+        self.on_frame = on_frame
+        self.frame_start = None
+
+        def timed_func(*func_args):
+            self.frame_start = time.perf_counter()
+            return func(*func_args)
+
+        super().__init__(fig, timed_func, *args, **kwargs)
+        self.event_source.add_callback(self.end_frame)
+
+    def end_frame(self):
+        if self.frame_start is not None:
+            self.on_frame(time.perf_counter() - self.frame_start)
+            self.frame_start = None
+
+
+class AnimationWindow:
+    """A figure showing boids and predators, with the controls common to all views.
 
+    Subclasses add their own widgets (extending setup_widgets), and make the
+    animation which updates the figure (make_animation).
+    """
 
-class InteractiveAnimation:
     ROTATION_SPEED = 1 / 10
 
-    def __init__(self, flock: Flock, fps: float = 30, show_axes: bool = True):
-        self.flock = flock
+    def __init__(
+        self,
+        bounds: np.ndarray,
+        position: np.ndarray,
+        predator_position: np.ndarray,
+        fps: float,
+        show_axes: bool,
+        show_hud: bool,
+        max_points: int | None,
+    ):
         self.fps = fps
-        self.step_size = 1 / fps
         self.show_axes = show_axes
-        self.ndim = flock.ndim
-        self.camera_orbit_enabled = True if self.ndim == 3 else False
+        self.show_hud = show_hud
+        self.stats = FrameStats()
+        self.display_stride = display_stride(len(position), max_points)
+        self.ndim = position.shape[1]
+        self.camera_orbit_enabled = self.ndim == 3
         self.camera_orbit_frame = 0
-        self.setup_plot()
+        self.setup_plot(bounds, position, predator_position)
         self.setup_widgets()
 
-    def run(self):
-        """Run application.
-
-        The application repeats with the seconds per iteration, cycle_seconds,
-        calculated such that camera rotation performs a full cycle each iteration."""
-        cycle_seconds = (360 / self.ROTATION_SPEED) / self.fps
-        self.total_frames = int(self.fps * cycle_seconds)
-        self.animation = FuncAnimation(
-            fig=self.fig,
-            func=self.update_plot,
-            frames=self.total_frames,
-            interval=1000 / self.fps,
-            repeat=True,
-            blit=True,
-        )
-        plt.show()
+    def make_animation(self) -> FrameTimedAnimation:
+        raise NotImplementedError
 
-    def update_plot(self, _: int):
-        """Update the animation scene.
+    def set_positions(self, position: np.ndarray, predator_position: np.ndarray):
+        """Move the boid & predator markers, drawing every display_stride-th boid."""
+        position = position[:: self.display_stride]
+        self.boids.set_data(position[:, 0], position[:, 1])
+        self.preds.set_data(predator_position[:, 0], predator_position[:, 1])
+        if self.ndim == 3:
+            self.boids.set_3d_properties(position[:, 2])
+            self.preds.set_3d_properties(predator_position[:, 2])
 
-        First updates the underlying flock model velocities and positions, and then
-        edits the agent positions accordingly.
+    def dynamic_artists(self, *extra) -> tuple:
+        """The artists to redraw on each frame.
 
-        If camera rotation is enabled (in the UI), also orbits the camera around the
-        scene, to aid in perception of depth.
+        Normally only the markers (and any extra artists) change, so everything else
+        is restored from a cached background. While the camera orbits, the whole plot
+        must be redrawn, so the axes are included first.
         """
-        self.flock.update(self.step_size)
-        self.boids.set_data(self.flock.position[:, 0], self.flock.position[:, 1])
-        self.preds.set_data(
-            self.flock.predator_position[:, 0], self.flock.predator_position[:, 1]
-        )
-        if self.ndim == 3:
-            self.boids.set_3d_properties(self.flock.position[:, 2])
-            self.preds.set_3d_properties(self.flock.predator_position[:, 2])
-
+        artists = (self.boids, self.preds, *extra)
         if self.camera_orbit_enabled:
-            self.ax_plot.view_init(
-                elev=15, azim=self.camera_orbit_frame * self.ROTATION_SPEED
-            )
-            self.camera_orbit_frame += 1
+            return (self.ax_plot, *artists)
+        return artists
 
-        return self.boids, self.preds, self.ax_plot
+    def redraw_background(self):
+        """Redraw the figure after a change to the static parts of the plot.
 
-    def setup_plot(self):
+        The animation caches the background behind the moving artists, so it is
+        replaced by a new one, which captures the background again once the figure
+        has been drawn.
+        """
+        if hasattr(self, "animation"):
+            self.animation.event_source.stop()
+            self.animation = self.make_animation()
+        self.fig.canvas.draw()
+
+    def setup_plot(
+        self,
+        bounds: np.ndarray,
+        position: np.ndarray,
+        predator_position: np.ndarray,
+    ):
         """Creates animation plot, and axes to display boids & predators."""
         fig = plt.figure(layout="constrained")
 
@@ -75,8 +132,8 @@ class InteractiveAnimation:
 
         # Set axis scales and limits
         ax_plot.set_aspect("equal")
-        ax_plot.set_xlim(0, self.flock.bounds[self.ndim + 0])
-        ax_plot.set_ylim(0, self.flock.bounds[self.ndim + 1])
+        ax_plot.set_xlim(0, bounds[self.ndim + 0])
+        ax_plot.set_ylim(0, bounds[self.ndim + 1])
         ax_plot.tick_params(
             left=False, bottom=False, labelleft=False, labelbottom=False
         )
@@ -85,21 +142,21 @@ class InteractiveAnimation:
             ax_plot.xaxis.set_pane_color((1.0, 1.0, 1.0, 0.0))
             ax_plot.yaxis.set_pane_color((1.0, 1.0, 1.0, 0.0))
             ax_plot.zaxis.set_pane_color((1.0, 1.0, 1.0, 0.0))
-            ax_plot.set_zlim(0, self.flock.bounds[self.ndim + 2])
+            ax_plot.set_zlim(0, bounds[self.ndim + 2])
 
         if not self.show_axes:
             ax_plot.set_axis_off()
 
         # Plot the boids and the predators
-        boid_size = 1 if self.flock.position.shape[0] > 1024 else 1.5
+        boid_size = 1 if position.shape[0] > 1024 else 1.5
         (self.boids,) = ax_plot.plot(
-            *self.flock.position.T,
+            *position[:: self.display_stride].T,
             markersize=boid_size,
             marker="o",
             linestyle="",
         )
         (self.preds,) = ax_plot.plot(
-            *self.flock.predator_position.T,
+            *predator_position.T,
             markersize=5,
             color="red",
             marker="o",
@@ -109,6 +166,18 @@ class InteractiveAnimation:
         # Add help text
         fig.text(0.02, 0.02, "(q) to quit", weight="bold")
 
+        # Performance overlay, drawn inside the plot axes so that it can be blitted
+        if self.show_hud:
+            text = ax_plot.text2D if self.ndim == 3 else ax_plot.text
+            self.hud_text = text(
+                0.02,
+                0.02,
+                "",
+                transform=ax_plot.transAxes,
+                family="monospace",
+                fontsize=8,
+            )
+
         # Make the window fullscreen
         figManager = plt.get_current_fig_manager()
         figManager.full_screen_toggle()
@@ -117,6 +186,178 @@ class InteractiveAnimation:
         self.fig = fig
         self.ax_plot = ax_plot
 
+    def setup_widgets(self):
+        """Configure the buttons controlling the view."""
+        # Add or remove axis lines
+        self.ax_axes_btn = self.fig.add_axes((0.65, 0.16, 0.2, 0.04))
+        self.axes_btn = Button(self.ax_axes_btn, "Show/hide axes")
+        self.axes_btn.on_clicked(self.show_or_hide_axes)
+
+        # Toggle rotation
+        if self.ndim == 3:
+            self.ax_rotation_btn = self.fig.add_axes((0.65, 0.11, 0.2, 0.04))
+            self.rotation_btn = Button(self.ax_rotation_btn, "Toggle camera orbit")
+            self.rotation_btn.on_clicked(self.toggle_camera_orbit)
+
+    def orbit_camera(self):
+        """Orbit the camera one frame around the scene, if enabled."""
+        if self.camera_orbit_enabled:
+            self.ax_plot.view_init(
+                elev=15, azim=self.camera_orbit_frame * self.ROTATION_SPEED
+            )
+            self.camera_orbit_frame += 1
+
+    def show_or_hide_axes(self, _):
+        if self.show_axes:
+            self.show_axes = False
+            self.ax_plot.set_axis_off()
+        else:
+            self.show_axes = True
+            self.ax_plot.set_axis_on()
+        self.redraw_background()
+
+    def toggle_camera_orbit(self, _):
+        if self.camera_orbit_enabled:
+            self.camera_orbit_enabled = False
+        else:
+            self.camera_orbit_enabled = True
+        self.redraw_background()
+
+
+class InteractiveAnimation(AnimationWindow):
+    def __init__(
+        self,
+        flock: Flock,
+        fps: float = 30,
+        show_axes: bool = True,
+        threaded: bool = False,
+        show_hud: bool = False,
+        pacer: AdaptivePacer | None = None,
+        max_points: int | None = None,
+    ):
+        """Create the animation window for a flock.
+
+        If threaded is set, the flock is simulated in a background SimulationWorker,
+        and each frame draws the latest completed step. Otherwise the flock is
+        stepped once per frame, before drawing.
+
+        If show_hud is set, the plot is overlaid with the time taken per simulation
+        step and per rendered frame, and the achieved framerate.
+
+        If a pacer is given, it replaces fps: the framerate, and the number of steps
+        simulated per frame, are adjusted as the animation runs to keep the flock in
+        real time. This is not supported when threaded, as the worker paces itself.
+
+        If max_points is set, at most that many boids are drawn (an evenly spaced
+        subset of them), to keep rendering fast for very large flocks. All boids are
+        still simulated.
+        """
+        if pacer is not None and threaded:
+            raise ValueError("Adaptive pacing cannot be combined with threading.")
+        self.flock = flock
+        self.pacer = pacer
+        if pacer is None:
+            self.step_size = 1 / fps
+            self.substeps = 1
+        else:
+            fps = pacer.fps
+            self.step_size = pacer.step_size
+            self.substeps = pacer.substeps
+        self.frame_sim_seconds = 0.0
+        self.worker = SimulationWorker(flock, self.step_size) if threaded else None
+        super().__init__(
+            flock.bounds,
+            flock.position,
+            flock.predator_position,
+            fps,
+            show_axes,
+            show_hud,
+            max_points,
+        )
+
+    def run(self):
+        """Run application.
+
+        The application repeats with the seconds per iteration, cycle_seconds,
+        calculated such that camera rotation performs a full cycle each iteration."""
+        cycle_seconds = (360 / self.ROTATION_SPEED) / self.fps
+        self.total_frames = int(self.fps * cycle_seconds)
+        self.animation = self.make_animation()
+        if self.worker is not None:
+            self.worker.start()
+        plt.show()
+        if self.worker is not None:
+            self.worker.stop()
+
+    def make_animation(self) -> FrameTimedAnimation:
+        return FrameTimedAnimation(
+            fig=self.fig,
+            func=self.update_plot,
+            frames=self.total_frames,
+            interval=1000 / self.fps,
+            repeat=True,
+            blit=True,
+            on_frame=self.record_frame,
+        )
+
+    def update_plot(self, _: int):
+        """Update the animation scene.
+
+        First updates the underlying flock model velocities and positions (or, if
+        threaded, takes the latest step from the worker), and then edits the agent
+        positions accordingly. If adaptively paced, the pacer may then change the
+        framerate and number of steps per frame.
+
+        If camera rotation is enabled (in the UI), also orbits the camera around the
+        scene, to aid in perception of depth.
+        """
+        self.stats.tick()
+        if self.worker is None:
+            start = time.perf_counter()
+            for _ in range(self.substeps):
+                self.flock.update(self.step_size)
+            self.frame_sim_seconds = time.perf_counter() - start
+            self.stats.record_sim(self.frame_sim_seconds / self.substeps)
+            position = self.flock.position
+            predator_position = self.flock.predator_position
+        else:
+            _, position, predator_position = self.worker.frames.read()
+
+        self.set_positions(position, predator_position)
+
+        self.orbit_camera()
+
+        if self.pacer is not None and self.pacer.update(self.stats):
+            self.fps = self.pacer.fps
+            self.step_size = self.pacer.step_size
+            self.substeps = self.pacer.substeps
+            self.animation.event_source.interval = 1000 / self.fps
+
+        if self.show_hud:
+            self.update_hud()
+            return self.dynamic_artists(self.hud_text)
+        return self.dynamic_artists()
+
+    def record_frame(self, seconds: float):
+        """Record the time taken by a frame, less the simulation step within it."""
+        if self.worker is None:
+            seconds -= self.frame_sim_seconds
+        self.stats.record_render(max(seconds, 0))
+
+    def update_hud(self):
+        """Show the latest timings in the overlay."""
+        if self.worker is None:
+            sim = f"sim {self.stats.sim_ms:.1f} ms/step x {self.substeps}"
+        else:
+            sim = (
+                f"sim {self.worker.step_ms:.1f} ms/step "
+                f"({self.worker.steps_per_second:.0f} steps/s)"
+            )
+        self.hud_text.set_text(
+            f"{sim}\nrender {self.stats.render_ms:.1f} ms/frame\n"
+            f"{self.stats.fps:.1f}/{self.fps:g} FPS"
+        )
+
     def setup_widgets(self):
         """Configure the application's interactive elements using Matplotlib widgets."""
         # Rule weights
@@ -190,18 +431,19 @@ class InteractiveAnimation:
         self.fig.text(0.75, 0.41, "Boid vision", ha="center", va="center", fontsize=12)
         self.ax_view_radius_slider = self.fig.add_axes((0.65, 0.36, 0.2, 0.03))
         self.ax_avoid_radius_slider = self.fig.add_axes((0.65, 0.33, 0.2, 0.03))
+        # Periodic boundaries limit the radii (see Flock.max_radius)
         self.view_radius_slider = Slider(
             self.ax_view_radius_slider,
             "View radius",
             1,
-            500,
+            min(500, self.flock.max_radius),
             valinit=self.flock.view_radius,
         )
         self.avoid_radius_slider = Slider(
             self.ax_avoid_radius_slider,
             "Avoidance radius",
             1,
-            100,
+            min(100, self.flock.max_radius),
             valinit=self.flock.avoid_radius,
             slidermax=self.view_radius_slider,
         )
@@ -212,14 +454,7 @@ class InteractiveAnimation:
         self.sub_predator_btn = Button(self.ax_sub_predator, "-1 Predator")
         self.add_predator_btn = Button(self.ax_add_predator, "+1 Predator")
 
-        # Add or remove axis lines
-        self.ax_axes_btn = self.fig.add_axes((0.65, 0.16, 0.2, 0.04))
-        self.axes_btn = Button(self.ax_axes_btn, "Show/hide axes")
-
-        # Toggle rotation
-        if self.ndim == 3:
-            self.ax_rotation_btn = self.fig.add_axes((0.65, 0.11, 0.2, 0.04))
-            self.rotation_btn = Button(self.ax_rotation_btn, "Toggle camera orbit")
+        super().setup_widgets()
 
         # Attach widget functionality
         # == Weights
@@ -237,54 +472,224 @@ class InteractiveAnimation:
         # == Add/remove predator
         self.sub_predator_btn.on_clicked(self.remove_predator)
         self.add_predator_btn.on_clicked(self.add_predator)
-        # == Axes control
-        self.axes_btn.on_clicked(self.show_or_hide_axes)
-        if self.ndim == 3:
-            self.rotation_btn.on_clicked(self.toggle_camera_orbit)
+
+    def apply(self, change: Callable[[Flock], None]):
+        """Apply a change to the flock, via the worker's queue if threaded."""
+        if self.worker is None:
+            change(self.flock)
+        else:
+            self.worker.submit(change)
 
     def set_minspeed(self, value):
-        self.flock.min_speed = value
+        self.apply(lambda flock: setattr(flock, "min_speed", value))
 
     def set_maxspeed(self, value):
-        self.flock.max_speed = value
+        self.apply(lambda flock: setattr(flock, "max_speed", value))
 
     def set_separation_weight(self, value):
-        self.flock.weights.separation = value
+        self.apply(lambda flock: setattr(flock.weights, "separation", value))
 
     def set_alignment_weight(self, value):
-        self.flock.weights.alignment = value
+        self.apply(lambda flock: setattr(flock.weights, "alignment", value))
 
     def set_cohesion_weight(self, value):
-        self.flock.weights.cohesion = value
+        self.apply(lambda flock: setattr(flock.weights, "cohesion", value))
 
     def set_flee_weight(self, value):
-        self.flock.weights.flee = value
+        self.apply(lambda flock: setattr(flock.weights, "flee", value))
 
     def set_seek_weight(self, value):
-        self.flock.weights.predator_seek = value
+        self.apply(lambda flock: setattr(flock.weights, "predator_seek", value))
 
     def set_view_radius(self, value):
-        self.flock.view_radius = value
+        self.apply(lambda flock: setattr(flock, "view_radius", value))
 
     def set_avoid_radius(self, value):
-        self.flock.avoid_radius = value
+        self.apply(lambda flock: setattr(flock, "avoid_radius", value))
 
     def add_predator(self, _):
-        self.flock.add_predator()
+        self.apply(Flock.add_predator)
 
     def remove_predator(self, _):
-        self.flock.remove_oldest_predator()
+        self.apply(Flock.remove_oldest_predator)
+
+
+class PlaybackAnimation(AnimationWindow):
+    """Plays back a trajectory recorded with boids.recording.TrajectoryRecorder.
+
+    Frames are loaded ahead of time in a background thread (see FramePrefetcher), so
+    playback runs at the full framerate regardless of how long the flock took to
+    simulate. The figure includes a slider to seek through the recording, and a
+    play/pause button.
+    """
+
+    def __init__(
+        self,
+        trajectory: Trajectory,
+        fps: float = 30,
+        show_axes: bool = True,
+        max_points: int | None = None,
+    ):
+        self.trajectory = trajectory
+        self.playing = True
+        self.prefetcher = FramePrefetcher(trajectory)
+        frame, position, predator_position = self.prefetcher.load(0)
+        super().__init__(
+            trajectory.bounds,
+            position,
+            predator_position,
+            fps,
+            show_axes,
+            False,
+            max_points,
+        )
+        self.show_frame(frame, position, predator_position)
 
-    def show_or_hide_axes(self, _):
-        if self.show_axes:
-            self.show_axes = False
-            self.ax_plot.set_axis_off()
-        else:
-            self.show_axes = True
-            self.ax_plot.set_axis_on()
+    def run(self):
+        """Run application, looping over the recording until the window is closed."""
+        self.prefetcher.start()
+        self.animation = self.make_animation()
+        plt.show()
+        self.prefetcher.stop()
 
-    def toggle_camera_orbit(self, _):
-        if self.camera_orbit_enabled:
-            self.camera_orbit_enabled = False
+    def make_animation(self) -> FrameTimedAnimation:
+        return FrameTimedAnimation(
+            fig=self.fig,
+            func=self.update_plot,
+            frames=None,
+            interval=1000 / self.fps,
+            blit=True,
+            cache_frame_data=False,
+            on_frame=self.stats.record_render,
+        )
+
+    def update_plot(self, _: int):
+        """Draw the next prefetched frame, if playing and it is available."""
+        if self.playing:
+            loaded = self.prefetcher.get()
+            if loaded is not None:
+                self.show_frame(*loaded)
+
+        self.orbit_camera()
+
+        return self.dynamic_artists(self.frame_text, self.ax_seek_slider)
+
+    def show_frame(
+        self, frame: int, position: np.ndarray, predator_position: np.ndarray
+    ):
+        """Move the boids & predators to the given frame."""
+        self.frame = frame
+        self.set_positions(position, predator_position)
+        self.frame_text.set_text(f"Frame {frame + 1}/{len(self.trajectory)}")
+        # Move the slider along, without seeking or redrawing the whole figure (it
+        # is blitted with the other moving artists)
+        self.seek_slider.eventson = False
+        self.seek_slider.drawon = False
+        self.seek_slider.set_val(frame)
+        self.seek_slider.eventson = True
+        self.seek_slider.drawon = True
+
+    def setup_widgets(self):
+        """Configure the seek slider and playback buttons."""
+        if self.ndim == 3:
+            self.frame_text = self.ax_plot.text2D(
+                0.02, 0.98, "", transform=self.ax_plot.transAxes
+            )
         else:
-            self.camera_orbit_enabled = True
+            self.frame_text = self.ax_plot.text(
+                0.02, 0.98, "", transform=self.ax_plot.transAxes
+            )
+
+        self.fig.text(0.75, 0.56, "Playback", ha="center", va="center", fontsize=12)
+        self.ax_seek_slider = self.fig.add_axes((0.65, 0.51, 0.2, 0.03))
+        self.seek_slider = Slider(
+            self.ax_seek_slider,
+            "Frame",
+            0,
+            len(self.trajectory) - 1,
+            valinit=0,
+            valstep=1,
+        )
+        self.ax_play_btn = self.fig.add_axes((0.65, 0.44, 0.2, 0.04))
+        self.play_btn = Button(self.ax_play_btn, "Play/pause")
+        super().setup_widgets()
+
+        # Attach widget functionality
+        self.seek_slider.on_changed(self.seek)
+        self.play_btn.on_clicked(self.toggle_playing)
+
+    def seek(self, value):
+        self.prefetcher.seek(int(value))
+        if not self.playing:
+            self.show_frame(*self.prefetcher.load(int(value)))
+            self.fig.canvas.draw_idle()
+
+    def toggle_playing(self, _):
+        self.playing = not self.playing
+
+
+class FramePrefetcher:
+    """Reads frames of a trajectory in a background thread, ahead of playback.
+
+    Frames are read in order (looping at the end of the recording) into a bounded
+    queue. Seeking discards any frames already queued, and restarts reading from the
+    requested frame.
+    """
+
+    def __init__(self, trajectory: Trajectory, buffer_frames: int = 64):
+        self.trajectory = trajectory
+        self.frames = queue.Queue(maxsize=buffer_frames)
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.next_frame = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.read_frames, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def load(self, frame: int) -> tuple[int, np.ndarray, np.ndarray]:
+        """Read a single frame into memory."""
+        n_predators = self.trajectory.predator_count[frame]
+        return (
+            frame,
+            np.array(self.trajectory.position[frame]),
+            np.array(self.trajectory.predator_position[frame, :n_predators]),
+        )
+
+    def seek(self, frame: int):
+        with self.lock:
+            self.generation += 1
+            self.next_frame = frame
+        while True:
+            try:
+                self.frames.get_nowait()
+            except queue.Empty:
+                break
+
+    def get(self) -> tuple[int, np.ndarray, np.ndarray] | None:
+        """Get the next frame, or None if it has not been read yet."""
+        while True:
+            try:
+                generation, loaded = self.frames.get_nowait()
+            except queue.Empty:
+                return None
+            if generation == self.generation:
+                return loaded
+
+    def read_frames(self):
+        while not self.stopped.is_set():
+            with self.lock:
+                generation, frame = self.generation, self.next_frame
+                self.next_frame = (frame + 1) % len(self.trajectory)
+            loaded = self.load(frame)
+            while not self.stopped.is_set() and generation == self.generation:
+                try:
+                    self.frames.put((generation, loaded), timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
@@ -0,0 +1,355 @@
+import itertools
+import json
+import platform
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import scipy
+
+from .metrics import polarization
+from .model import Flock, flocking_rules
+from .neighbors import make_neighbor_index
+from .profiling import PhaseTimer
+
+DIMS = [1024, 1024, 1024]
+
+
+def benchmark_case(
+    n_boids: int,
+    ndim: int,
+    view_radius: float,
+    n_predators: int,
+    neighbor_index: str = "kdtree",
+    dtype: str = "float64",
+    backend: str = "numpy",
+    n_steps: int = 20,
+    warmup_steps: int = 2,
+    step_size: float = 1 / 30,
+    random_seed: int = 0,
+) -> dict:
+    """Time Flock.update, and each of its phases, for a single configuration.
+
+    The flock uses the same speeds and avoidance radius as the CLI (see make_flock). Index build and
+    pair-query times are also measured separately, on the final state of the flock,
+    as Flock times them together in its neighbors phase. For backends other than
+    NumPy, the result also includes rule_error (see backend_error).
+    """
+    flock = make_flock(
+        n_boids,
+        ndim,
+        view_radius,
+        n_predators,
+        random_seed,
+        neighbor_index=neighbor_index,
+        dtype=dtype,
+        backend=backend,
+    )
+    for _ in range(warmup_steps):
+        flock.update(step_size)
+
+    flock.profiler = PhaseTimer()
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        flock.update(step_size)
+    elapsed = time.perf_counter() - start
+
+    index = make_neighbor_index(neighbor_index, flock.bounds)
+    radius = max(flock.view_radius, flock.avoid_radius)
+    start = time.perf_counter()
+    index.build(flock.position.copy())
+    build_time = time.perf_counter() - start
+    start = time.perf_counter()
+    i, _ = index.query_pairs(radius)
+    query_time = time.perf_counter() - start
+
+    result = {
+        "n_boids": n_boids,
+        "ndim": ndim,
+        "view_radius": view_radius,
+        "n_predators": n_predators,
+        "neighbor_index": neighbor_index,
+        "dtype": dtype,
+        "backend": flock.backend,
+        "n_steps": n_steps,
+        "ms_per_step": 1000 * elapsed / n_steps,
+        "steps_per_second": n_steps / elapsed,
+        "mean_neighbors": 2 * len(i) / n_boids,
+        "phases": flock.profiler.summary(),
+        "index_build_ms": 1000 * build_time,
+        "pair_query_ms": 1000 * query_time,
+    }
+    if flock.backend != "numpy":
+        result["rule_error"] = backend_error(flock)
+    return result
+
+
+def backend_error(flock: Flock) -> float:
+    """Largest difference between the flock's rule forces and the NumPy reference.
+
+    The forces are evaluated on the flock's current state, by its backend and by
+    flocking_rules, and the difference is relative to the largest reference force.
+    """
+    radius = max(flock.view_radius, flock.avoid_radius)
+    index = make_neighbor_index("kdtree", flock.bounds)
+    index.build(flock.position.copy())
+    reference = flocking_rules(
+        flock.position,
+        flock.velocity,
+        *index.query_pairs(radius),
+        flock.avoid_radius,
+        flock.view_radius,
+    )
+    forces = flock.fused_rules(
+        flock.position, flock.velocity, flock.avoid_radius, flock.view_radius
+    )
+    return max(
+        float(np.abs(force - expected).max() / np.abs(expected).max())
+        for force, expected in zip(forces, reference)
+    )
+
+
+def benchmark(
+    n_boids: list[int],
+    ndims: list[int],
+    view_radii: list[float],
+    n_predators: list[int],
+    neighbor_indexes: list[str],
+    dtypes: list[str] = ("float64",),
+    backends: list[str] = ("numpy",),
+    n_steps: int = 20,
+    verbose: bool = True,
+) -> dict:
+    """Run benchmark_case over every combination of the given parameters.
+
+    Returns a JSON-serialisable dict holding the results for each case, and details
+    of the machine and library versions.
+    """
+    results = []
+    for case in itertools.product(
+        n_boids, ndims, view_radii, n_predators, neighbor_indexes, dtypes, backends
+    ):
+        result = benchmark_case(*case, n_steps=n_steps)
+        results.append(result)
+        if verbose:
+            print(
+                "n_boids={} ndim={} view_radius={} n_predators={} index={} "
+                "dtype={} backend={}: {:.2f} ms/step".format(
+                    *case, result["ms_per_step"]
+                )
+            )
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "scipy": scipy.__version__,
+        "results": results,
+    }
+
+
+def compare_dtypes(
+    n_boids: int,
+    ndim: int,
+    view_radius: float,
+    n_predators: int = 0,
+    n_steps: int = 300,
+    step_size: float = 1 / 30,
+    random_seed: int = 0,
+) -> dict:
+    """Measure how far a float32 flock drifts from the same flock in float64.
+
+    Both flocks start from the same state (rounded to float32), and are stepped
+    together. Flocking is chaotic, so individual trajectories eventually separate
+    however small the rounding error; the collective state (polarization and mean
+    speed) should remain close.
+
+    Returns, for each step, the maximum and mean distance between the positions of
+    corresponding boids, and the difference in polarization.
+    """
+    flocks = [
+        make_flock(n_boids, ndim, view_radius, n_predators, random_seed, dtype=dtype)
+        for dtype in ("float64", "float32")
+    ]
+    max_error, mean_error, polarization_error = [], [], []
+    for _ in range(n_steps):
+        for flock in flocks:
+            flock.update(step_size)
+        reference, reduced = flocks
+        error = np.linalg.norm(reference.position - reduced.position, axis=1)
+        max_error.append(float(error.max()))
+        mean_error.append(float(error.mean()))
+        polarization_error.append(
+            abs(polarization(reference.velocity) - polarization(reduced.velocity))
+        )
+    return {
+        "n_boids": n_boids,
+        "ndim": ndim,
+        "view_radius": view_radius,
+        "n_predators": n_predators,
+        "n_steps": n_steps,
+        "max_position_error": max_error,
+        "mean_position_error": mean_error,
+        "polarization_error": polarization_error,
+    }
+
+
+def compare_force_intervals(
+    n_boids: int,
+    ndim: int,
+    view_radius: float,
+    n_predators: int = 0,
+    force_intervals: list[int] = (2, 4, 8),
+    n_steps: int = 300,
+    step_size: float = 1 / 30,
+    random_seed: int = 0,
+) -> dict:
+    """Measure the speed and accuracy of reusing rule forces (see Flock.force_interval).
+
+    A flock is stepped with each force interval, alongside a reference flock which
+    recomputes the rules on every step, all from the same initial state. As for
+    compare_dtypes, individual trajectories separate, so accuracy is measured on
+    collective metrics: polarization, and cohesion as the mean distance of boids
+    from the center of mass (spread). Fleeing is recomputed on every step, so pass
+    n_predators to measure how much of the speedup survives predators.
+
+    Returns, for each force interval, the time per step and speedup over the
+    reference, the mean and final absolute difference in polarization, and the mean
+    and final difference in spread relative to the reference.
+    """
+    intervals = [1, *force_intervals]
+    flocks = [
+        make_flock(
+            n_boids,
+            ndim,
+            view_radius,
+            n_predators,
+            random_seed,
+            force_interval=interval,
+        )
+        for interval in intervals
+    ]
+    elapsed = np.zeros(len(flocks))
+    polarizations = np.empty((len(flocks), n_steps))
+    spreads = np.empty((len(flocks), n_steps))
+    for step in range(n_steps):
+        for k, flock in enumerate(flocks):
+            start = time.perf_counter()
+            flock.update(step_size)
+            elapsed[k] += time.perf_counter() - start
+            polarizations[k, step] = polarization(flock.velocity)
+            spreads[k, step] = spread(flock.position)
+
+    polarization_error = np.abs(polarizations - polarizations[0])
+    spread_error = np.abs(spreads - spreads[0]) / spreads[0]
+    return {
+        "n_boids": n_boids,
+        "ndim": ndim,
+        "view_radius": view_radius,
+        "n_predators": n_predators,
+        "n_steps": n_steps,
+        "results": [
+            {
+                "force_interval": interval,
+                "ms_per_step": 1000 * elapsed[k] / n_steps,
+                "speedup": float(elapsed[0] / elapsed[k]),
+                "mean_polarization_error": float(polarization_error[k].mean()),
+                "final_polarization_error": float(polarization_error[k, -1]),
+                "mean_spread_error": float(spread_error[k].mean()),
+                "final_spread_error": float(spread_error[k, -1]),
+            }
+            for k, interval in enumerate(intervals)
+        ],
+    }
+
+
+def memory_case(
+    n_boids: int,
+    ndim: int,
+    view_radius: float,
+    chunk_size: int | None = None,
+    random_seed: int = 0,
+) -> dict:
+    """Measure the peak memory allocated by one Flock.compute_acceleration.
+
+    Memory is traced with tracemalloc, which sees every NumPy array (including the
+    neighbor pairs), but not the internal nodes of scipy's KDTree; those are O(n_boids)
+    and do not depend on the density of the flock. state_mb is the size of the
+    boid state itself, for comparison.
+    """
+    flock = make_flock(
+        n_boids, ndim, view_radius, 0, random_seed, chunk_size=chunk_size
+    )
+    tracemalloc.start()
+    flock.compute_acceleration()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "n_boids": n_boids,
+        "ndim": ndim,
+        "view_radius": view_radius,
+        "chunk_size": chunk_size,
+        "peak_mb": peak / 2**20,
+        "state_mb": flock.state.nbytes / 2**20,
+    }
+
+
+def memory_benchmark(
+    n_boids: list[int],
+    ndims: list[int],
+    view_radii: list[float],
+    chunk_sizes: list[int | None] = (None, 16384),
+    verbose: bool = True,
+) -> list[dict]:
+    """Run memory_case over every combination of the given parameters.
+
+    A chunk size of None measures the default (unchunked) path.
+    """
+    results = []
+    for case in itertools.product(n_boids, ndims, view_radii, chunk_sizes):
+        result = memory_case(*case)
+        results.append(result)
+        if verbose:
+            print(
+                "n_boids={} ndim={} view_radius={} chunk_size={}: "
+                "{:.1f} MB peak ({:.1f} MB state)".format(
+                    *case, result["peak_mb"], result["state_mb"]
+                )
+            )
+    return results
+
+
+def spread(position: np.ndarray) -> float:
+    """Mean distance of the boids from their center of mass."""
+    return float(np.linalg.norm(position - position.mean(axis=0), axis=1).mean())
+
+
+def make_flock(
+    n_boids: int,
+    ndim: int,
+    view_radius: float,
+    n_predators: int,
+    random_seed: int,
+    **kwargs,
+) -> Flock:
+    """A flock with the same speeds and avoidance radius as the CLI."""
+    return Flock(
+        n_boids=n_boids,
+        n_predators=n_predators,
+        bounds=DIMS[:ndim],
+        min_speed=130,
+        max_speed=170,
+        predator_min_speed=260,
+        predator_max_speed=350,
+        view_radius=view_radius,
+        avoid_radius=20,
+        random_seed=random_seed,
+        **kwargs,
+    )
+
+
+def write_results(results: dict, path: str):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
@@ -0,0 +1,197 @@
+import dataclasses
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from .model import Flock, PredatorBuffer, Weights
+
+FORMAT_VERSION = 1
+
+
+def save_checkpoint(flock: Flock, path: str | Path):
+    """Save the full state of a flock to a single .npz file.
+
+    The file holds the boid and predator arrays, the cached neighbor pairs (for lazy
+    rebuilds) and rule acceleration (for force_interval > 1), and a JSON document
+    with the flock's parameters and the state of its random number generators, so
+    that a flock restored with load_checkpoint continues exactly as the original
+    would have. Arrays are stored uncompressed, so saving and
+    loading are limited only by disk bandwidth.
+
+    The file is written to a temporary path and then moved into place, so an
+    interrupted save never corrupts an existing checkpoint. Observers and profilers
+    are not saved.
+    """
+    path = Path(path)
+    neighbor_state = flock.neighbors.get_state()
+    metadata = {
+        "version": FORMAT_VERSION,
+        "iteration": flock.iteration,
+        "dtype": flock.dtype.name,
+        "bounds": flock.bounds[flock.ndim :].tolist(),
+        "barrier_pct": 100 * flock.barrier_pct,
+        "min_speed": flock.min_speed,
+        "max_speed": flock.max_speed,
+        "predator_min_speed": flock.predator_min_speed,
+        "predator_max_speed": flock.predator_max_speed,
+        "view_radius": flock.view_radius,
+        "avoid_radius": flock.avoid_radius,
+        "weights": dataclasses.asdict(flock.weights),
+        "neighbor_index": flock.neighbor_index.name,
+        "rebuild_interval": flock.neighbors.rebuild_interval,
+        "skin": flock.neighbors.skin,
+        "reaction_threshold": flock.neighbors.reaction_threshold,
+        "workers": flock.workers,
+        "backend": flock.backend,
+        "boundary": flock.boundary,
+        "n_nearest": flock.n_nearest,
+        "chunk_size": flock.chunk_size,
+        "force_interval": flock.force_interval,
+        "neighbor_cache": {
+            key: value
+            for key, value in neighbor_state.items()
+            if not isinstance(value, np.ndarray)
+        },
+        "rng": rng_state(flock.rng),
+        # None if boids and predators share a single stream
+        "predator_rng": None
+        if flock.predator_rng is flock.rng
+        else rng_state(flock.predator_rng),
+    }
+    arrays = {
+        "state": flock.state,
+        "barrier_bounds": flock.barrier_bounds,
+        "predator_position": flock.predator_position,
+        "predator_velocity": flock.predator_velocity,
+        "predator_acceleration": flock.predator_acceleration,
+    }
+    arrays.update(
+        {
+            f"neighbor_{key}": value
+            for key, value in neighbor_state.items()
+            if isinstance(value, np.ndarray)
+        }
+    )
+    if flock.rule_acceleration is not None:
+        arrays["rule_acceleration"] = flock.rule_acceleration
+
+    temporary = path.with_name(path.name + ".tmp")
+    with open(temporary, "wb") as f:
+        np.savez(f, metadata=np.array(json.dumps(metadata)), **arrays)
+    os.replace(temporary, path)
+
+
+def load_checkpoint(path: str | Path) -> Flock:
+    """Restore a flock saved with save_checkpoint."""
+    with np.load(path) as data:
+        metadata = json.loads(data["metadata"].item())
+        if metadata["version"] != FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported checkpoint version {metadata['version']} "
+                f"(expected {FORMAT_VERSION})."
+            )
+        arrays = {key: data[key] for key in data.files if key != "metadata"}
+
+    state = arrays["state"]
+    flock = Flock(
+        n_boids=state.shape[1],
+        min_speed=metadata["min_speed"],
+        max_speed=metadata["max_speed"],
+        predator_min_speed=metadata["predator_min_speed"],
+        predator_max_speed=metadata["predator_max_speed"],
+        view_radius=metadata["view_radius"],
+        avoid_radius=metadata["avoid_radius"],
+        weights=Weights(**metadata["weights"]),
+        bounds=metadata["bounds"],
+        barrier_pct=metadata["barrier_pct"],
+        initial_position=state[0],
+        initial_velocity=state[1],
+        neighbor_index=metadata["neighbor_index"],
+        rebuild_interval=metadata["rebuild_interval"],
+        skin=metadata["skin"],
+        reaction_threshold=metadata["reaction_threshold"],
+        workers=metadata["workers"],
+        dtype=metadata["dtype"],
+        backend=metadata["backend"],
+        boundary=metadata.get("boundary", "walls"),
+        n_nearest=metadata.get("n_nearest"),
+        chunk_size=metadata.get("chunk_size"),
+        force_interval=metadata.get("force_interval", 1),
+    )
+
+    # Construction recomputes (and may round) the state, so overwrite it exactly
+    flock.state[...] = state
+    flock.barrier_bounds = arrays["barrier_bounds"]
+    flock.predators = PredatorBuffer(
+        arrays["predator_position"], arrays["predator_velocity"], flock.dtype
+    )
+    flock.predator_acceleration = arrays["predator_acceleration"]
+    if "rule_acceleration" in arrays:
+        flock.rule_acceleration = arrays["rule_acceleration"]
+    flock.neighbors.set_state(
+        metadata["neighbor_cache"]
+        | {
+            key.removeprefix("neighbor_"): value
+            for key, value in arrays.items()
+            if key.startswith("neighbor_")
+        }
+    )
+    flock.iteration = metadata["iteration"]
+    flock.rng = restore_rng(metadata["rng"])
+    if metadata.get("predator_rng") is None:
+        flock.predator_rng = flock.rng
+    else:
+        flock.predator_rng = restore_rng(metadata["predator_rng"])
+    return flock
+
+
+def rng_state(rng: np.random.Generator | np.random.RandomState) -> dict:
+    """The state of a random number generator, as JSON-serialisable data."""
+    if isinstance(rng, np.random.RandomState):
+        return {"type": "RandomState", "state": encode(rng.get_state(legacy=False))}
+    return {"type": "Generator", "state": encode(rng.bit_generator.state)}
+
+
+def restore_rng(saved: dict) -> np.random.Generator | np.random.RandomState:
+    """Recreate a random number generator from rng_state."""
+    state = decode(saved["state"])
+    if saved["type"] == "RandomState":
+        rng = np.random.RandomState()
+        rng.set_state(state)
+        return rng
+    bit_generator = getattr(np.random, state["bit_generator"])()
+    bit_generator.state = state
+    return np.random.Generator(bit_generator)
+
+
+def encode(value):
+    """Convert any arrays nested in value to JSON-serialisable dicts."""
+    if isinstance(value, dict):
+        return {key: encode(item) for key, item in value.items()}
+    if isinstance(value, np.ndarray):
+        return {"array": value.tolist(), "dtype": value.dtype.str}
+    return value
+
+
+def decode(value):
+    """Invert encode."""
+    if isinstance(value, dict):
+        if value.keys() == {"array", "dtype"}:
+            return np.array(value["array"], dtype=value["dtype"])
+        return {key: decode(item) for key, item in value.items()}
+    return value
+
+
+class Checkpointer:
+    """Saves a checkpoint of a flock every `every` steps, overwriting the last."""
+
+    def __init__(self, path: str | Path, flock: Flock, every: int):
+        self.path = Path(path)
+        self.every = every
+        flock.observers.append(self)
+
+    def __call__(self, flock: Flock):
+        if flock.iteration % self.every == 0:
+            save_checkpoint(flock, self.path)
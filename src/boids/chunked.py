@@ -0,0 +1,120 @@
+import numpy as np
+
+from .neighbors import CellList, GridIndex
+
+
+class ChunkedRules:
+    """Evaluates the flocking rules over spatially sorted chunks of boids.
+
+    Boids are sorted into grid cells (see CellList) and processed chunk_size at a
+    time, so working memory is bounded by the chunk size rather than by the total
+    number of neighboring pairs. If periodic is set, the grid wraps around at the
+    bounds.
+    """
+
+    def __init__(self, bounds: np.ndarray, chunk_size: int, periodic: bool = False):
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1.")
+        self.index = GridIndex(bounds, periodic)
+        self.chunk_size = chunk_size
+        self.periodic = periodic
+
+    def __call__(
+        self,
+        position: np.ndarray,
+        velocity: np.ndarray,
+        avoid_radius: float,
+        view_radius: float,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Compute (avoidance, alignment, cohesion), as for flocking_rules."""
+        # The index keeps a reference to the positions, which Flock updates in-place
+        self.index.build(position.copy())
+        cells = self.index.cell_list(max(avoid_radius, view_radius))
+        sorted_position = cells.sorted_position
+        sorted_velocity = velocity[cells.order]
+        coords = cells.coords[cells.order]
+
+        forces = np.empty((3, *position.shape), dtype=np.float64)
+        for start in range(0, len(position), self.chunk_size):
+            stop = min(start + self.chunk_size, len(position))
+            self.chunk_rules(
+                sorted_position,
+                sorted_velocity,
+                coords[start:stop],
+                start,
+                cells,
+                avoid_radius,
+                view_radius,
+                forces[:, start:stop],
+            )
+        # Reorder in place, one force at a time, rather than allocating a copy
+        unsorted = np.empty(position.shape, dtype=np.float64)
+        for force in forces:
+            unsorted[cells.order] = force
+            force[...] = unsorted
+        return forces[0], forces[1], forces[2]
+
+    def chunk_rules(
+        self,
+        position: np.ndarray,
+        velocity: np.ndarray,
+        coords: np.ndarray,
+        start: int,
+        cells: CellList,
+        avoid_radius: float,
+        view_radius: float,
+        out: np.ndarray,
+    ):
+        """Write the forces on boids start:start + len(coords) (in cell order) to out."""
+        n_chunk = len(coords)
+        avoidance, neighbor_sum = out[0], out[1]
+        avoidance[...] = 0
+        neighbor_sum[...] = 0
+        # With periodic boundaries, positions are summed as offsets from the boid
+        cohesion_sum = out[2]
+        cohesion_sum[...] = 0
+        n_neighbors = np.zeros(n_chunk, dtype=np.intp)
+
+        radius = max(avoid_radius, view_radius)
+        for offset in self.index.full_stencil:
+            source, rank = cells.candidates(coords, offset)
+            separation = self.index.separation(position[start + source], position[rank])
+            dist_sq = np.einsum("ij,ij->i", separation, separation)
+            # Most candidates are out of range, so are discarded before anything else
+            keep = (dist_sq <= radius**2) & (rank != start + source)
+            source, rank = source[keep], rank[keep]
+            separation, dist_sq = separation[keep], dist_sq[keep]
+
+            close = dist_sq <= avoid_radius**2
+            accumulate(avoidance, source[close], separation[close])
+
+            sight = dist_sq <= view_radius**2
+            source, rank = source[sight], rank[sight]
+            n_neighbors += np.bincount(source, minlength=n_chunk)
+            accumulate(neighbor_sum, source, velocity[rank])
+            if self.periodic:
+                accumulate(cohesion_sum, source, -separation[sight])
+            else:
+                accumulate(cohesion_sum, source, position[rank])
+
+        denominator = np.maximum(1, n_neighbors)[:, None]
+        chunk = slice(start, start + n_chunk)
+        neighbor_sum /= denominator
+        neighbor_sum -= velocity[chunk]
+        cohesion_sum /= denominator
+        if not self.periodic:
+            cohesion_sum -= position[chunk]
+
+    def query_points(
+        self, position: np.ndarray, points: np.ndarray, radius: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Find boids within radius of each point, in the grid from the last call."""
+        return self.index.query_points(points, radius)
+
+
+def accumulate(total: np.ndarray, index: np.ndarray, values: np.ndarray):
+    """Add rows of values to the rows of total given by index."""
+    for dim in range(total.shape[1]):
+        total[:, dim] += np.bincount(
+            index, weights=values[:, dim], minlength=len(total)
+        )
@@ -1,10 +1,27 @@
 import argparse
+import itertools
+import sys
+import time
 
-
-from .model import Flock
-from .animation import InteractiveAnimation
+from .benchmark import (
+    benchmark,
+    compare_dtypes,
+    compare_force_intervals,
+    memory_benchmark,
+    write_results,
+)
+from .checkpoint import Checkpointer, load_checkpoint, save_checkpoint
+from .metrics import MetricsRecorder
+from .model import BACKENDS, BOUNDARIES, Flock
+from .neighbors import NEIGHBOR_INDEXES
+from .pacing import AdaptivePacer
+from .profiling import PhaseTimer
+from .recording import Trajectory, TrajectoryRecorder
+from .scenario import load_scenario
+from .simulate import simulate
 
 DIMS = [1024, 1024, 1024]
+DTYPES = ("float64", "float32")
 
 
 def set_default_fps(n_boids: int) -> int:
@@ -28,31 +45,628 @@ def set_default_view_radius(n_boids: int) -> int:
 
 
 def run():
-    """A minimal CLI to drive the boids application."""
-    parser = argparse.ArgumentParser("Interactive Boid simulation.")
-    parser.add_argument("n_boids", type=int, help="Number of boids to simulate.")
+    """A minimal CLI to drive the boids application.
+
+    By default this opens the interactive animation. The first argument may instead
+    name a subcommand (see COMMANDS), e.g. `boids simulate 10000 --steps 500`.
+    """
+    argv = sys.argv[1:]
+    if argv and argv[0] in COMMANDS:
+        COMMANDS[argv[0]](argv[1:])
+    else:
+        run_interactive(argv)
+
+
+def run_interactive(argv: list[str]):
+    """Open the interactive animation."""
+    # Imported here so that matplotlib is only loaded when it is needed
+    from .animation import InteractiveAnimation
+
+    parser = argparse.ArgumentParser(
+        "Interactive Boid simulation.",
+        epilog="Run `boids simulate -h` for headless simulation, `boids replay -h` to "
+        "play back a recording, or `boids export -h` to render a video.",
+    )
+    add_flock_arguments(parser)
     parser.add_argument(
         "--framerate",
         type=int,
         default=None,
-        help="Frames per second (FPS). If not specified, simulation uses a default based on n_boids.",
+        help="Frames per second (FPS). If not specified, simulation uses a default based on the number of boids.",
+    )
+
+    parser.add_argument(
+        "--threaded",
+        action="store_true",
+        help="Simulate in a background thread, so slow steps don't stall the window.",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Adjust the framerate, and the number of steps per frame, to keep the "
+        "simulation in real time. --framerate then sets the highest framerate used.",
+    )
+    parser.add_argument(
+        "--max-step-size",
+        type=float,
+        default=1 / 30,
+        help="Longest simulated step when --adaptive is set, in seconds.",
+    )
+    parser.add_argument(
+        "--max-points",
+        type=int,
+        default=None,
+        help="Draw at most this many boids (an evenly spaced subset), for speed.",
+    )
+    parser.add_argument(
+        "--hud",
+        action="store_true",
+        help="Overlay simulation and rendering times, and the achieved framerate.",
+    )
+
+    args = parser.parse_args(argv)
+    if args.adaptive and args.threaded:
+        parser.error("--adaptive cannot be combined with --threaded")
+    check_flock_arguments(parser, args)
+    flock = make_flock(args)
+    fps = args.framerate or set_default_fps(len(flock))
+    if args.profile:
+        flock.profiler = PhaseTimer()
+
+    pacer = None
+    if args.adaptive:
+        pacer = AdaptivePacer(
+            max_fps=args.framerate or 60, max_step_size=args.max_step_size
+        )
+
+    metrics = start_metrics(args, flock)
+    animation = InteractiveAnimation(
+        flock,
+        fps=fps,
+        threaded=args.threaded,
+        show_hud=args.hud,
+        pacer=pacer,
+        max_points=args.max_points,
     )
+    try:
+        animation.run()
+    finally:
+        if metrics is not None:
+            metrics.close()
+    if args.profile:
+        print(flock.profiler.report())
+        print(animation.stats.report())
 
-    args = parser.parse_args()
-    n_boids = args.n_boids
-    fps = args.framerate or set_default_fps(n_boids)
-    view_radius = set_default_view_radius(n_boids)
 
-    flock = Flock(
-        n_boids=n_boids,
+def run_simulate(argv: list[str]):
+    """Advance a flock without rendering, as fast as possible."""
+    parser = argparse.ArgumentParser("boids simulate")
+    add_flock_arguments(parser)
+    parser.add_argument(
+        "--steps",
+        type=int,
+        default=1000,
+        help="Number of steps to simulate (in total, when resuming).",
+    )
+    parser.add_argument(
+        "--step-size",
+        type=float,
+        default=1 / 30,
+        help="Simulated seconds per step (default is one frame at 30 FPS).",
+    )
+    parser.add_argument(
+        "--record",
+        default=None,
+        help="Directory to record the trajectory to (see boids.recording).",
+    )
+    parser.add_argument(
+        "--record-every",
+        type=int,
+        default=1,
+        help="Record every k-th step.",
+    )
+    parser.add_argument(
+        "--compress",
+        action="store_true",
+        help="Compress each recorded chunk once it is complete.",
+    )
+    parser.add_argument(
+        "--max-predators",
+        type=int,
+        default=16,
+        help="Most predators recorded in each frame; any more are dropped, with a "
+        "warning.",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default=None,
+        help="File to periodically save the flock's state to (see boids.checkpoint).",
+    )
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=1000,
+        help="Save a checkpoint every k-th step.",
+    )
+    parser.add_argument(
+        "--resume",
+        default=None,
+        help="Checkpoint to continue from. The flock arguments are then ignored, "
+        "except for the predator schedule of a --scenario.",
+    )
+
+    args = parser.parse_args(argv)
+    if args.resume is not None:
+        if args.record is not None:
+            parser.error("--record cannot be combined with --resume")
+        flock = load_checkpoint(args.resume)
+        if args.scenario is not None:
+            load_scenario(args.scenario).follow_schedule(flock)
+    else:
+        check_flock_arguments(parser, args)
+        flock = make_flock(args)
+    if args.profile:
+        flock.profiler = PhaseTimer()
+    recorder = None
+    if args.record is not None:
+        recorder = TrajectoryRecorder(
+            args.record,
+            flock,
+            every=args.record_every,
+            compress=args.compress,
+            max_predators=args.max_predators,
+        )
+    if args.checkpoint is not None:
+        Checkpointer(args.checkpoint, flock, args.checkpoint_every)
+    metrics = start_metrics(args, flock)
+
+    n_steps = max(0, args.steps - flock.iteration)
+    try:
+        elapsed = simulate(flock, n_steps, args.step_size)
+    finally:
+        if recorder is not None:
+            recorder.close()
+        if metrics is not None:
+            metrics.close()
+    if args.checkpoint is not None:
+        save_checkpoint(flock, args.checkpoint)
+    print(
+        f"Simulated {n_steps} steps of {len(flock)} boids in {elapsed:.2f}s "
+        f"({n_steps / max(elapsed, 1e-9):.1f} steps/s)"
+    )
+    if args.profile:
+        print(flock.profiler.report())
+
+
+def run_replay(argv: list[str]):
+    """Play back a recorded trajectory."""
+    from .animation import PlaybackAnimation
+
+    parser = argparse.ArgumentParser("boids replay")
+    parser.add_argument(
+        "path", help="Directory containing a recording (see boids simulate --record)."
+    )
+    parser.add_argument(
+        "--framerate", type=int, default=30, help="Frames per second (FPS)."
+    )
+    parser.add_argument(
+        "--max-points",
+        type=int,
+        default=None,
+        help="Draw at most this many boids (an evenly spaced subset), for speed.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print a summary of the frame times when finished.",
+    )
+
+    args = parser.parse_args(argv)
+    animation = PlaybackAnimation(
+        Trajectory(args.path), fps=args.framerate, max_points=args.max_points
+    )
+    animation.run()
+    if args.profile:
+        print(animation.stats.report())
+
+
+def run_export(argv: list[str]):
+    """Render a recording, or a newly simulated flock, to a video or images."""
+    from .export import (
+        display_stride,
+        export,
+        make_writer,
+        simulated_frames,
+        trajectory_frames,
+    )
+
+    parser = argparse.ArgumentParser(
+        "boids export",
+        epilog="Pass either n_boids or --scenario (and flock arguments) to simulate a "
+        "new flock, or --recording to render a recorded trajectory.",
+    )
+    parser.add_argument(
+        "output",
+        help="Video file to encode with ffmpeg (.mp4, .webm, .gif, ...), or otherwise "
+        "a directory to write numbered PNG images to.",
+    )
+    add_flock_arguments(parser)
+    parser.add_argument(
+        "--recording",
+        default=None,
+        help="Directory containing a recording to render (see boids simulate --record).",
+    )
+    parser.add_argument(
+        "--seconds",
+        type=float,
+        default=None,
+        help="Length of the video (default 10s, or the whole recording).",
+    )
+    parser.add_argument(
+        "--framerate", type=int, default=30, help="Frames per second (FPS)."
+    )
+    parser.add_argument(
+        "--max-step-size",
+        type=float,
+        default=1 / 30,
+        help="Longest simulated step, in seconds; frames are split into sub-steps.",
+    )
+    parser.add_argument(
+        "--size",
+        default="1280x720",
+        help="Frame size in pixels, as WIDTHxHEIGHT.",
+    )
+    parser.add_argument("--dpi", type=int, default=100, help="Resolution of the plot.")
+    parser.add_argument(
+        "--render-workers",
+        type=int,
+        default=1,
+        help="Number of processes to render frames in.",
+    )
+    parser.add_argument(
+        "--max-points",
+        type=int,
+        default=None,
+        help="Draw at most this many boids (an evenly spaced subset), for speed.",
+    )
+    parser.add_argument(
+        "--no-orbit",
+        action="store_true",
+        help="Keep the camera still, rather than orbiting 3D flocks.",
+    )
+    parser.add_argument(
+        "--hide-axes", action="store_true", help="Don't draw the axis lines."
+    )
+
+    args = parser.parse_args(argv)
+    try:
+        width, height = (int(n) for n in args.size.lower().split("x"))
+    except ValueError:
+        parser.error(f"invalid --size {args.size!r}, expected WIDTHxHEIGHT")
+
+    n_frames = None if args.seconds is None else round(args.seconds * args.framerate)
+    metrics = None
+    if args.recording is not None:
+        trajectory = Trajectory(args.recording)
+        bounds, ndim = trajectory.bounds, trajectory.ndim
+        n_boids = trajectory.position.shape[1]
+        stride = display_stride(n_boids, args.max_points)
+        frames = trajectory_frames(trajectory, stop=n_frames, stride=stride)
+    else:
+        check_flock_arguments(parser, args)
+        flock = make_flock(args)
+        if args.profile:
+            flock.profiler = PhaseTimer()
+        metrics = start_metrics(args, flock)
+        bounds, ndim, n_boids = flock.bounds, flock.ndim, len(flock)
+        stride = display_stride(n_boids, args.max_points)
+        frames = simulated_frames(
+            flock,
+            n_frames or 10 * args.framerate,
+            args.framerate,
+            args.max_step_size,
+            stride=stride,
+        )
+
+    settings = {
+        "bounds": bounds,
+        "ndim": ndim,
+        "n_boids": n_boids,
+        "width": width,
+        "height": height,
+        "dpi": args.dpi,
+        "show_axes": not args.hide_axes,
+        "orbit": not args.no_orbit,
+    }
+    try:
+        writer = make_writer(args.output, (width, height), args.framerate)
+    except FileNotFoundError as error:
+        parser.error(str(error))
+    start = time.perf_counter()
+    try:
+        n_written = export(frames, writer, settings, workers=args.render_workers)
+    finally:
+        writer.close()
+        if metrics is not None:
+            metrics.close()
+    elapsed = time.perf_counter() - start
+    print(
+        f"Exported {n_written} frames ({n_written / args.framerate:.1f}s of video) "
+        f"in {elapsed:.2f}s ({n_written / max(elapsed, 1e-9):.1f} frames/s)"
+    )
+    if args.profile and args.recording is None:
+        print(flock.profiler.report())
+
+
+def run_bench(argv: list[str]):
+    """Time Flock.update over a matrix of configurations."""
+    parser = argparse.ArgumentParser("boids bench")
+    parser.add_argument(
+        "--n-boids", type=int, nargs="+", default=[500, 1000, 1500, 5000]
+    )
+    parser.add_argument("--ndim", type=int, nargs="+", default=[2, 3])
+    parser.add_argument("--view-radius", type=float, nargs="+", default=[50, 150])
+    parser.add_argument("--predators", type=int, nargs="+", default=[0, 5])
+    parser.add_argument(
+        "--neighbors", choices=NEIGHBOR_INDEXES, nargs="+", default=["kdtree"]
+    )
+    parser.add_argument("--dtype", choices=DTYPES, nargs="+", default=["float64"])
+    parser.add_argument("--backend", choices=BACKENDS, nargs="+", default=["numpy"])
+    parser.add_argument(
+        "--steps", type=int, default=20, help="Number of steps timed per case."
+    )
+    parser.add_argument(
+        "--output", default="benchmark.json", help="File to write results to."
+    )
+    parser.add_argument(
+        "--compare-dtypes",
+        type=int,
+        default=0,
+        metavar="STEPS",
+        help="Also compare float32 against float64 trajectories over this many steps.",
+    )
+    parser.add_argument(
+        "--compare-force-intervals",
+        type=int,
+        default=0,
+        metavar="STEPS",
+        help="Also compare the speed and accuracy of each --force-interval against "
+        "recomputing the rules on every step, over this many steps.",
+    )
+    parser.add_argument(
+        "--force-interval",
+        type=int,
+        nargs="+",
+        default=[2, 4, 8],
+        help="Force intervals to compare with --compare-force-intervals.",
+    )
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="Instead of timing, measure the peak memory of computing acceleration, "
+        "unchunked and with each --chunk-size.",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        nargs="+",
+        default=[16384],
+        help="Chunk sizes to compare with --memory.",
+    )
+
+    args = parser.parse_args(argv)
+    if args.memory:
+        results = memory_benchmark(
+            args.n_boids, args.ndim, args.view_radius, [None, *args.chunk_size]
+        )
+        write_results({"memory": results}, args.output)
+        return
+    results = benchmark(
+        args.n_boids,
+        args.ndim,
+        args.view_radius,
+        args.predators,
+        args.neighbors,
+        args.dtype,
+        args.backend,
+        n_steps=args.steps,
+    )
+    if args.compare_dtypes:
+        results["dtype_comparison"] = []
+        for case in itertools.product(
+            args.n_boids, args.ndim, args.view_radius, args.predators
+        ):
+            comparison = compare_dtypes(*case, n_steps=args.compare_dtypes)
+            results["dtype_comparison"].append(comparison)
+            print(
+                "n_boids={} ndim={} view_radius={} n_predators={}: float32 drifts "
+                "{:.3g} (mean), {:.3g} (max) after {} steps".format(
+                    *case,
+                    comparison["mean_position_error"][-1],
+                    comparison["max_position_error"][-1],
+                    args.compare_dtypes,
+                )
+            )
+    if args.compare_force_intervals:
+        results["force_interval_comparison"] = []
+        for case in itertools.product(
+            args.n_boids, args.ndim, args.view_radius, args.predators
+        ):
+            comparison = compare_force_intervals(
+                *case, args.force_interval, n_steps=args.compare_force_intervals
+            )
+            results["force_interval_comparison"].append(comparison)
+            for result in comparison["results"][1:]:
+                print(
+                    "n_boids={} ndim={} view_radius={} n_predators={} "
+                    "force_interval={}: {:.2f}x faster, polarization error {:.3g} "
+                    "(mean), spread error {:.2%} (mean)".format(
+                        *case,
+                        result["force_interval"],
+                        result["speedup"],
+                        result["mean_polarization_error"],
+                        result["mean_spread_error"],
+                    )
+                )
+    write_results(results, args.output)
+
+
+def add_flock_arguments(parser: argparse.ArgumentParser):
+    """Arguments shared by all commands which construct a Flock.
+
+    Check them with check_flock_arguments once parsed.
+    """
+    parser.add_argument(
+        "n_boids",
+        type=int,
+        nargs="?",
+        help="Number of boids to simulate (unless given by --scenario).",
+    )
+    parser.add_argument(
+        "--scenario",
+        default=None,
+        help="TOML or JSON file describing the flock and its seed (see "
+        "boids.scenario). Its options override the ones below.",
+    )
+    parser.add_argument(
+        "--predators",
+        type=int,
+        default=0,
+        help="Initial number of predators (ignored with --scenario).",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=None,
+        help="Random seed for the initial state (overrides that of a --scenario).",
+    )
+    parser.add_argument(
+        "--neighbors",
+        choices=NEIGHBOR_INDEXES,
+        default="kdtree",
+        help="Spatial index used to find nearby boids.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of threads to compute boid interactions with.",
+    )
+    parser.add_argument(
+        "--dtype",
+        choices=DTYPES,
+        default="float64",
+        help="Floating-point type of the boid state.",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="numpy",
+        help="Implementation of the flocking rules (numba requires the numba extra).",
+    )
+    parser.add_argument(
+        "--nearest",
+        type=int,
+        default=None,
+        metavar="K",
+        help="Interact with the K nearest boids, rather than all those within the view "
+        "radius.",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=None,
+        help="Compute interactions in chunks of this many boids, to bound memory use "
+        "for very large flocks. Steps are 3-4 times slower at any chunk size, so only "
+        "use this when memory runs out.",
+    )
+    parser.add_argument(
+        "--force-interval",
+        type=int,
+        default=1,
+        metavar="M",
+        help="Recompute the neighbor-based rules only every M steps, reusing them in "
+        "between, for speed.",
+    )
+    parser.add_argument(
+        "--boundary",
+        choices=BOUNDARIES,
+        default="walls",
+        help="Keep boids in with walls, or wrap space around at the edges (periodic).",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Time each phase of the update, and print a summary when finished.",
+    )
+    parser.add_argument(
+        "--metrics",
+        default=None,
+        help="File to stream summary metrics of the flock to (see boids.metrics).",
+    )
+    parser.add_argument(
+        "--metrics-every",
+        type=int,
+        default=1,
+        help="Record metrics every k-th step.",
+    )
+
+
+def check_flock_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    """Check that the flock is described by exactly one of n_boids and --scenario."""
+    if args.scenario is not None and args.n_boids is not None:
+        parser.error("n_boids cannot be combined with --scenario")
+    if args.scenario is None and args.n_boids is None:
+        parser.error("either n_boids or --scenario is required")
+
+
+def start_metrics(args: argparse.Namespace, flock: Flock) -> MetricsRecorder | None:
+    """Record metrics of the flock, if requested by the --metrics argument."""
+    if args.metrics is None:
+        return None
+    return MetricsRecorder(args.metrics, flock, every=args.metrics_every)
+
+
+def make_flock(args: argparse.Namespace) -> Flock:
+    """Construct the flock described by the command-line arguments."""
+    options = {
+        "neighbor_index": args.neighbors,
+        "workers": args.workers,
+        "dtype": args.dtype,
+        "backend": args.backend,
+        "boundary": args.boundary,
+        "n_nearest": args.nearest,
+        "chunk_size": args.chunk_size,
+        "force_interval": args.force_interval,
+    }
+    if args.scenario is not None:
+        scenario = load_scenario(args.scenario)
+        unseeded = scenario.seed is None and args.seed is None
+        if args.seed is not None:
+            scenario.seed = args.seed
+        flock = scenario.make_flock(**options)
+        if unseeded:
+            print(f"Scenario seed: {scenario.seed} (pass --seed to repeat this run)")
+        return flock
+
+    return Flock(
+        n_boids=args.n_boids,
+        n_predators=args.predators,
         bounds=DIMS,
         min_speed=130,
         max_speed=170,
         predator_min_speed=260,
         predator_max_speed=350,
-        view_radius=view_radius,
+        view_radius=set_default_view_radius(args.n_boids),
         avoid_radius=20,
+        random_seed=args.seed,
+        **options,
     )
 
-    animation = InteractiveAnimation(flock, fps=fps)
-    animation.run()
+
+COMMANDS = {
+    "simulate": run_simulate,
+    "replay": run_replay,
+    "export": run_export,
+    "bench": run_bench,
+}
@@ -0,0 +1,182 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+
+from .metrics import polarization
+from .model import Flock, bound_norm, flocking_rules, wall_nudge
+from .neighbors import KDTreeIndex
+
+
+class Ensemble:
+    """Many independent flocks, advanced together in one vectorised update.
+
+    Members are given as Flock instances, which must have the same number of boids
+    and the same bounds, with walls, no predators and metric (not n_nearest)
+    neighbors, but may otherwise differ in their weights, speeds and radii. Every
+    step is exact, so members cannot use force_interval, rebuild_interval or
+    chunk_size (unsupported members raise a ValueError), and their neighbor index,
+    backend and workers are not used. State is stored in stacked arrays of shape
+    (n_flocks, n_boids, ndim), and parameters in arrays of shape (n_flocks,).
+
+    Neighbors for all members are found with a single KDTree, in which each member
+    is offset along the first axis to keep members apart. Any pairs between
+    different members are discarded, and each pair uses its own member's radii.
+
+    This removes the per-step Python overhead of each member, which dominates for
+    sweeps over many small flocks. For large flocks the per-pair work dominates
+    instead, and batching gains little; use run_ensemble to spread members over
+    processes.
+    """
+
+    def __init__(self, flocks: list[Flock]):
+        first = flocks[0]
+        for flock in flocks:
+            if len(flock) != len(first) or not np.array_equal(
+                flock.barrier_bounds, first.barrier_bounds
+            ):
+                raise ValueError(
+                    "Ensemble members must have the same number of boids and bounds."
+                )
+            if len(flock.predator_position) > 0:
+                raise ValueError("Ensemble members cannot have predators.")
+            if flock.box is not None:
+                raise ValueError("Ensemble members cannot have periodic boundaries.")
+            if flock.n_nearest is not None:
+                raise ValueError("Ensemble members cannot use n_nearest.")
+            if flock.force_interval > 1 or flock.neighbors.rebuild_interval > 1:
+                raise ValueError(
+                    "Ensemble members cannot use force_interval or rebuild_interval "
+                    "> 1."
+                )
+            if flock.chunk_size is not None:
+                raise ValueError("Ensemble members cannot use chunk_size.")
+
+        self.n_flocks = len(flocks)
+        self.n_boids = len(first)
+        self.ndim = first.ndim
+        self.bounds = first.bounds
+        self.barrier_bounds = first.barrier_bounds
+        self.iteration = 0
+
+        self.position = np.stack([flock.position for flock in flocks])
+        self.velocity = np.stack([flock.velocity for flock in flocks])
+        self.acceleration = np.zeros_like(self.velocity)
+
+        self.min_speed = np.array([flock.min_speed for flock in flocks])
+        self.max_speed = np.array([flock.max_speed for flock in flocks])
+        self.view_radius = np.array([flock.view_radius for flock in flocks])
+        self.avoid_radius = np.array([flock.avoid_radius for flock in flocks])
+        self.separation = np.array([flock.weights.separation for flock in flocks])
+        self.alignment = np.array([flock.weights.alignment for flock in flocks])
+        self.cohesion = np.array([flock.weights.cohesion for flock in flocks])
+        self.containment = np.array([flock.weights.containment for flock in flocks])
+
+        self.compute_acceleration()
+
+    def update(self, step_size: float = 1):
+        """Update the velocity and position of all members, as for Flock.update."""
+        velocity = (self.velocity + self.acceleration * step_size).reshape(
+            -1, self.ndim
+        )
+        self.velocity = bound_norm(
+            velocity,
+            np.repeat(self.min_speed, self.n_boids),
+            np.repeat(self.max_speed, self.n_boids),
+        ).reshape(self.position.shape)
+        self.position += self.velocity * step_size
+
+        self.compute_acceleration()
+        self.iteration += 1
+
+    def compute_acceleration(self):
+        """Compute acceleration for all members, as for Flock.compute_acceleration."""
+        extent = self.bounds[self.ndim] - self.bounds[0]
+        radius = max(self.view_radius.max(), self.avoid_radius.max())
+        spacing = 2 * extent + radius
+        shifted = self.position.copy()
+        shifted[:, :, 0] += np.arange(self.n_flocks)[:, None] * spacing
+
+        index = KDTreeIndex()
+        index.build(shifted.reshape(-1, self.ndim))
+        i, j = index.query_pairs(radius)
+        member = i // self.n_boids
+        same = member == j // self.n_boids
+        i, j, member = i[same], j[same], member[same]
+
+        avoidance, alignment, cohesion = (
+            force.reshape(self.position.shape)
+            for force in flocking_rules(
+                self.position.reshape(-1, self.ndim),
+                self.velocity.reshape(-1, self.ndim),
+                i,
+                j,
+                self.avoid_radius[member],
+                self.view_radius[member],
+            )
+        )
+        self.acceleration = (
+            avoidance * self.separation[:, None, None]
+            + alignment * self.alignment[:, None, None]
+            + cohesion * self.cohesion[:, None, None]
+        )
+
+        nudge = wall_nudge(
+            self.position, self.barrier_bounds, self.avoid_radius[:, None]
+        )
+        self.acceleration += nudge * (self.max_speed * self.containment)[:, None, None]
+
+    def summary(self) -> dict[str, np.ndarray]:
+        """Summary statistics for each member, as arrays of shape (n_flocks,).
+
+        - polarization: norm of the mean heading of the moving boids (see
+          boids.metrics.polarization)
+        - mean_speed: mean boid speed
+        - spread: mean distance of boids from their member's center of mass
+        """
+        speed = np.linalg.norm(self.velocity, axis=2)
+        center_of_mass = self.position.mean(axis=1, keepdims=True)
+        return {
+            "polarization": polarization(self.velocity),
+            "mean_speed": speed.mean(axis=1),
+            "spread": np.linalg.norm(self.position - center_of_mass, axis=2).mean(
+                axis=1
+            ),
+        }
+
+
+def run_ensemble(
+    members: list[dict],
+    n_steps: int,
+    step_size: float = 1 / 30,
+    workers: int = 1,
+) -> dict[str, np.ndarray]:
+    """Simulate many flocks, returning the summary statistics of each.
+
+    Each member is given as a dict of Flock arguments. Members are divided into one
+    batch per worker, and each batch is simulated as an Ensemble in its own process.
+    Returns Ensemble.summary for all members, in order.
+    """
+    batches = [
+        [members[k] for k in batch]
+        for batch in np.array_split(np.arange(len(members)), workers)
+        if len(batch) > 0
+    ]
+    if workers == 1:
+        results = [run_batch(batches[0], n_steps, step_size)]
+    else:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(
+                pool.map(run_batch, batches, repeat(n_steps), repeat(step_size))
+            )
+    return {key: np.concatenate([r[key] for r in results]) for key in results[0]}
+
+
+def run_batch(
+    members: list[dict], n_steps: int, step_size: float
+) -> dict[str, np.ndarray]:
+    """Simulate a batch of flocks as one Ensemble, returning its summary."""
+    ensemble = Ensemble([Flock(**kwargs) for kwargs in members])
+    for _ in range(n_steps):
+        ensemble.update(step_size)
+    return ensemble.summary()
@@ -0,0 +1,288 @@
+import math
+import shutil
+import subprocess
+from collections import deque
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from .model import Flock
+from .recording import Trajectory
+
+VIDEO_SUFFIXES = (".mp4", ".mkv", ".mov", ".webm", ".avi", ".gif")
+
+# (frame, position, predator_position), as passed to FrameRenderer.render
+Frame = tuple[int, np.ndarray, np.ndarray]
+
+
+class FrameRenderer:
+    """Draws frames of a flock offscreen, with the Agg backend, as RGB arrays.
+
+    The plot is styled like the interactive animation, without its widgets. If
+    orbit is set (3D only), the camera orbits the scene at the same speed as in the
+    animation, and the whole figure is drawn for each frame. Otherwise the axes are
+    drawn once, and each frame only redraws the boids and predators over a copy of
+    them, which is several times faster.
+    """
+
+    ROTATION_SPEED = 1 / 10
+
+    def __init__(
+        self,
+        bounds: np.ndarray,
+        ndim: int,
+        n_boids: int,
+        width: int = 1280,
+        height: int = 720,
+        dpi: int = 100,
+        show_axes: bool = True,
+        orbit: bool = True,
+    ):
+        self.ndim = ndim
+        self.orbit = orbit and ndim == 3
+        self.fig = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.fig)
+
+        if ndim == 2:
+            ax = self.fig.add_axes((0, 0, 1, 1))
+        elif ndim == 3:
+            ax = self.fig.add_axes((0, 0, 1, 1), projection="3d", focal_length=0.3)
+        else:
+            raise ValueError("Only dimensions 2 and 3 are supported.")
+        ax.set_aspect("equal")
+        ax.set_xlim(0, bounds[ndim + 0])
+        ax.set_ylim(0, bounds[ndim + 1])
+        ax.tick_params(left=False, bottom=False, labelleft=False, labelbottom=False)
+        if ndim == 3:
+            ax.xaxis.set_pane_color((1.0, 1.0, 1.0, 0.0))
+            ax.yaxis.set_pane_color((1.0, 1.0, 1.0, 0.0))
+            ax.zaxis.set_pane_color((1.0, 1.0, 1.0, 0.0))
+            ax.set_zlim(0, bounds[ndim + 2])
+            ax.view_init(elev=15, azim=0)
+        if not show_axes:
+            ax.set_axis_off()
+
+        empty = np.empty((0, ndim))
+        (self.boids,) = ax.plot(
+            *empty.T,
+            markersize=1 if n_boids > 1024 else 1.5,
+            marker="o",
+            linestyle="",
+        )
+        (self.preds,) = ax.plot(
+            *empty.T, markersize=5, color="red", marker="o", linestyle=""
+        )
+        self.ax = ax
+
+        self.background = None
+        if not self.orbit:
+            self.boids.set_animated(True)
+            self.preds.set_animated(True)
+            self.canvas.draw()
+            self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+
+    def render(
+        self, frame: int, position: np.ndarray, predator_position: np.ndarray
+    ) -> np.ndarray:
+        """Draw a frame, returning its pixels as an array of shape (height, width, 3)."""
+        self.boids.set_data(position[:, 0], position[:, 1])
+        self.preds.set_data(predator_position[:, 0], predator_position[:, 1])
+        if self.ndim == 3:
+            self.boids.set_3d_properties(position[:, 2])
+            self.preds.set_3d_properties(predator_position[:, 2])
+
+        if self.orbit:
+            self.ax.view_init(elev=15, azim=frame * self.ROTATION_SPEED)
+            self.canvas.draw()
+        else:
+            self.canvas.restore_region(self.background)
+            self.ax.draw_artist(self.boids)
+            self.ax.draw_artist(self.preds)
+        return np.asarray(self.canvas.buffer_rgba())[..., :3]
+
+
+# Each worker process keeps one renderer, created by init_worker
+_renderer = None
+
+
+def init_worker(settings: dict):
+    global _renderer
+    _renderer = FrameRenderer(**settings)
+
+
+def render_in_worker(frame: Frame) -> bytes:
+    return _renderer.render(*frame).tobytes()
+
+
+class FFmpegWriter:
+    """Encodes raw RGB frames to a video file by piping them to ffmpeg."""
+
+    def __init__(
+        self,
+        path: str | Path,
+        size: tuple[int, int],
+        fps: float,
+        codec: str = "libx264",
+        extra_args: Iterable[str] = ("-pix_fmt", "yuv420p"),
+    ):
+        ffmpeg = shutil.which("ffmpeg")
+        if ffmpeg is None:
+            raise FileNotFoundError(
+                "ffmpeg was not found; install it, or export an image sequence."
+            )
+        if Path(path).suffix == ".gif":
+            codec, extra_args = "gif", ()
+        width, height = size
+        self.process = subprocess.Popen(
+            [
+                ffmpeg,
+                "-loglevel",
+                "error",
+                "-y",
+                "-f",
+                "rawvideo",
+                "-pix_fmt",
+                "rgb24",
+                "-s",
+                f"{width}x{height}",
+                "-r",
+                f"{fps:g}",
+                "-i",
+                "-",
+                "-vcodec",
+                codec,
+                *extra_args,
+                str(path),
+            ],
+            stdin=subprocess.PIPE,
+        )
+
+    def write(self, frame: int, rgb: bytes):
+        self.process.stdin.write(rgb)
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with code {self.process.returncode}.")
+
+
+class ImageSequenceWriter:
+    """Writes each frame to a numbered PNG image in a directory."""
+
+    def __init__(self, path: str | Path, size: tuple[int, int]):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.size = size
+
+    def write(self, frame: int, rgb: bytes):
+        from PIL import Image
+
+        Image.frombuffer("RGB", self.size, rgb).save(
+            self.path / f"frame_{frame:05d}.png", compress_level=1
+        )
+
+    def close(self):
+        pass
+
+
+def make_writer(
+    path: str | Path, size: tuple[int, int], fps: float
+) -> FFmpegWriter | ImageSequenceWriter:
+    """An FFmpegWriter for paths with a video suffix (see VIDEO_SUFFIXES), otherwise
+    an ImageSequenceWriter into the directory at path."""
+    if Path(path).suffix.lower() in VIDEO_SUFFIXES:
+        return FFmpegWriter(path, size, fps)
+    return ImageSequenceWriter(path, size)
+
+
+def display_stride(n_boids: int, max_points: int | None) -> int:
+    """Step between the boids drawn, to draw at most max_points of them."""
+    if max_points is None:
+        return 1
+    return max(1, math.ceil(n_boids / max_points))
+
+
+def trajectory_frames(
+    trajectory: Trajectory,
+    start: int = 0,
+    stop: int | None = None,
+    stride: int = 1,
+) -> Iterator[Frame]:
+    """Frames of a recording, read one at a time."""
+    for frame in range(*slice(start, stop).indices(len(trajectory))):
+        n_predators = trajectory.predator_count[frame]
+        yield (
+            frame,
+            np.array(trajectory.position[frame, ::stride]),
+            np.array(trajectory.predator_position[frame, :n_predators]),
+        )
+
+
+def simulated_frames(
+    flock: Flock,
+    n_frames: int,
+    fps: float,
+    max_step_size: float = 1 / 30,
+    stride: int = 1,
+) -> Iterator[Frame]:
+    """Frames of a flock as it is simulated, starting from its current state.
+
+    Each frame advances the flock by 1 / fps seconds, in sub-steps no longer than
+    max_step_size (as for AdaptivePacer). Positions are copied as float32.
+    """
+    substeps = max(1, math.ceil(1 / (fps * max_step_size) - 1e-9))
+    step_size = 1 / (fps * substeps)
+    for frame in range(n_frames):
+        if frame > 0:
+            for _ in range(substeps):
+                flock.update(step_size)
+        yield (
+            frame,
+            flock.position[::stride].astype(np.float32),
+            flock.predator_position.astype(np.float32),
+        )
+
+
+def export(
+    frames: Iterable[Frame],
+    writer: FFmpegWriter | ImageSequenceWriter,
+    settings: dict,
+    workers: int = 1,
+    max_pending: int | None = None,
+) -> int:
+    """Render frames with FrameRenderer(**settings), and write them in order.
+
+    With more than one worker, frames are rendered in parallel in a pool of
+    processes, while this process produces the next frames (e.g. by simulating them)
+    and writes the finished ones. At most max_pending frames (twice the number of
+    workers by default) are in flight at once, so memory use does not grow with the
+    length of the export. Returns the number of frames written.
+    """
+    n_written = 0
+    if workers == 1:
+        renderer = FrameRenderer(**settings)
+        for frame in frames:
+            writer.write(frame[0], renderer.render(*frame).tobytes())
+            n_written += 1
+        return n_written
+
+    max_pending = max_pending or 2 * workers
+    pending = deque()
+    with ProcessPoolExecutor(
+        workers, initializer=init_worker, initargs=(settings,)
+    ) as pool:
+        for frame in frames:
+            if len(pending) == max_pending:
+                index, result = pending.popleft()
+                writer.write(index, result.result())
+                n_written += 1
+            pending.append((frame[0], pool.submit(render_in_worker, frame)))
+        while pending:
+            index, result = pending.popleft()
+            writer.write(index, result.result())
+            n_written += 1
+    return n_written
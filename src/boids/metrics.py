@@ -0,0 +1,235 @@
+import json
+from pathlib import Path
+
+import numpy as np
+from scipy.sparse import csr_array
+from scipy.sparse.csgraph import connected_components
+
+from .model import Flock
+from .neighbors import KDTreeIndex, make_neighbor_index, minimum_image
+
+FORMAT_VERSION = 1
+METRICS = ("polarization", "nearest_neighbor", "clusters", "predators")
+HISTOGRAM_BINS = 16
+
+# Fields of each record, by metric
+FIELDS = {
+    "polarization": [("polarization", "<f4"), ("mean_speed", "<f4")],
+    "nearest_neighbor": [
+        ("nn_mean", "<f4"),
+        ("nn_p10", "<f4"),
+        ("nn_p50", "<f4"),
+        ("nn_p90", "<f4"),
+        ("nn_isolated", "<f4"),
+        ("nn_histogram", "<u4", (HISTOGRAM_BINS,)),
+    ],
+    "clusters": [("n_clusters", "<i4"), ("largest_cluster", "<i4")],
+    "predators": [
+        ("predator_nearest_min", "<f4"),
+        ("predator_nearest_mean", "<f4"),
+        ("boids_near_predators", "<i4"),
+    ],
+}
+
+
+class MetricsRecorder:
+    """Computes summary metrics of a flock as it is simulated, and streams them to disk.
+
+    The metrics are chosen from METRICS:
+    - polarization: norm of the mean heading of the moving boids (1 if all are
+      aligned, NaN if none are moving), and the mean speed
+    - nearest_neighbor: mean and 10th, 50th and 90th percentiles of the distance from
+      each boid to its nearest neighbor, the fraction of boids with no neighbor
+      within the view radius (which are excluded from the other statistics), and a
+      histogram of the distances in HISTOGRAM_BINS bins up to the view radius
+    - clusters: the number of connected groups of boids, where boids within the view
+      radius of each other are connected, and the size of the largest
+    - predators: the smallest and mean (over predators) distance from each predator
+      to its nearest boid, and the number of boids within the view radius of any
+      predator (NaN and 0 without predators), found with a KDTree of the boids
+
+    Neighbors are taken from the pairs found by the flock's own update (see
+    Flock.pairs), so apart from the clustering and the predator metrics (which cost
+    O((n_boids + n_predators) log n_boids)), every metric costs O(n_boids + n_pairs)
+    per step. Only flocks with fused rules (workers > 1, numba, n_nearest or
+    chunk_size), and steps which reuse the rule forces (force_interval > 1), need a
+    separate neighbor search, which for chunked flocks undoes their bound on memory
+    use.
+
+    The recorder records the current state on creation, then every `every`-th step.
+    Each record is appended to the file as a fixed-size binary row, after a JSON
+    header line; read the file with read_metrics. Call close() when finished.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        flock: Flock,
+        every: int = 1,
+        metrics: tuple[str, ...] = METRICS,
+    ):
+        unknown = set(metrics) - set(METRICS)
+        if unknown:
+            raise ValueError(f"Unknown metrics {sorted(unknown)}, expected {METRICS}.")
+        self.path = Path(path)
+        self.flock = flock
+        self.every = every
+        self.metrics = tuple(metric for metric in METRICS if metric in metrics)
+        self.dtype = np.dtype(
+            [("iteration", "<i8")]
+            + [field for metric in self.metrics for field in FIELDS[metric]]
+        )
+        self.record_buffer = np.zeros((), dtype=self.dtype)
+        self.index = None
+        self.predator_index = KDTreeIndex(flock.box)
+
+        self.file = open(self.path, "wb")
+        header = {
+            "version": FORMAT_VERSION,
+            "fields": [
+                [name, self.dtype[name].base.str, list(self.dtype[name].shape)]
+                for name in self.dtype.names
+            ],
+            "every": every,
+            "n_boids": len(flock),
+            "view_radius": flock.view_radius,
+            "histogram_bins": HISTOGRAM_BINS,
+        }
+        self.file.write(json.dumps(header).encode() + b"\n")
+
+        self.record(flock)
+        flock.observers.append(self)
+
+    def __call__(self, flock: Flock):
+        if flock.iteration % self.every == 0:
+            self.record(flock)
+
+    def record(self, flock: Flock):
+        """Compute the metrics for the current state, and append them to the file."""
+        record = self.record_buffer
+        record["iteration"] = flock.iteration
+        if "polarization" in self.metrics:
+            record["polarization"] = polarization(flock.velocity)
+            record["mean_speed"] = np.linalg.norm(flock.velocity, axis=1).mean()
+
+        if "nearest_neighbor" in self.metrics or "clusters" in self.metrics:
+            i, j, distance = self.neighbor_pairs(flock)
+            if "nearest_neighbor" in self.metrics:
+                self.record_nearest_neighbor(record, len(flock), i, j, distance)
+            if "clusters" in self.metrics:
+                graph = csr_array(
+                    (np.ones(len(i), dtype=np.int8), (i, j)),
+                    shape=(len(flock), len(flock)),
+                )
+                n_clusters, labels = connected_components(graph, directed=False)
+                record["n_clusters"] = n_clusters
+                record["largest_cluster"] = np.bincount(labels).max()
+
+        if "predators" in self.metrics:
+            self.record_predators(record, flock)
+
+        self.file.write(record.tobytes())
+
+    def neighbor_pairs(self, flock: Flock) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Pairs of boids within the view radius, and the distances between them."""
+        if flock.pairs is not None:
+            i, j = flock.pairs
+        else:
+            if self.index is None:
+                self.index = make_neighbor_index(
+                    flock.neighbor_index.name,
+                    flock.bounds,
+                    periodic=flock.box is not None,
+                )
+            self.index.build(flock.position.copy())
+            i, j = self.index.query_pairs(flock.view_radius)
+        offset = flock.position[i] - flock.position[j]
+        if flock.box is not None:
+            minimum_image(offset, flock.box)
+        dist_sq = np.einsum("ij,ij->i", offset, offset)
+        near = dist_sq <= flock.view_radius**2
+        return i[near], j[near], np.sqrt(dist_sq[near])
+
+    def record_nearest_neighbor(
+        self,
+        record: np.ndarray,
+        n_boids: int,
+        i: np.ndarray,
+        j: np.ndarray,
+        distance: np.ndarray,
+    ):
+        nearest = np.full(n_boids, np.inf)
+        np.minimum.at(nearest, i, distance)
+        np.minimum.at(nearest, j, distance)
+        found = nearest[np.isfinite(nearest)]
+        record["nn_isolated"] = 1 - len(found) / n_boids
+        if len(found) == 0:
+            for name in ("nn_mean", "nn_p10", "nn_p50", "nn_p90"):
+                record[name] = np.nan
+            record["nn_histogram"] = 0
+            return
+        record["nn_mean"] = found.mean()
+        record["nn_p10"], record["nn_p50"], record["nn_p90"] = np.percentile(
+            found, (10, 50, 90)
+        )
+        record["nn_histogram"] = np.histogram(
+            found, bins=HISTOGRAM_BINS, range=(0, self.flock.view_radius)
+        )[0]
+
+    def record_predators(self, record: np.ndarray, flock: Flock):
+        predator_position = flock.predator_position
+        if len(predator_position) == 0:
+            record["predator_nearest_min"] = np.nan
+            record["predator_nearest_mean"] = np.nan
+            record["boids_near_predators"] = 0
+            return
+        index = self.predator_index
+        index.build(flock.position)
+        nearest, _ = index.tree.query(predator_position)
+        _, boid_index = index.query_points(predator_position, flock.view_radius)
+        near = np.zeros(len(flock), dtype=bool)
+        near[boid_index] = True
+        record["predator_nearest_min"] = nearest.min()
+        record["predator_nearest_mean"] = nearest.mean()
+        record["boids_near_predators"] = near.sum()
+
+    def close(self):
+        """Flush remaining records, and stop recording the flock."""
+        self.file.close()
+        if self in self.flock.observers:
+            self.flock.observers.remove(self)
+
+
+def polarization(velocity: np.ndarray) -> np.ndarray:
+    """Norm of the mean heading of the moving boids (1 if all are aligned).
+
+    Boids are along the second-last axis of velocity, so a stack of flocks gives one
+    value per flock. Boids at rest have no heading, so are left out, and flocks with
+    no moving boids give NaN.
+    """
+    speed = np.linalg.norm(velocity, axis=-1, keepdims=True)
+    moving = speed > 0
+    heading = np.divide(velocity, speed, out=np.zeros(velocity.shape), where=moving)
+    with np.errstate(invalid="ignore"):
+        return np.linalg.norm(heading.sum(axis=-2), axis=-1) / moving.sum(axis=(-2, -1))
+
+
+def read_metrics(path: str | Path) -> tuple[dict, np.ndarray]:
+    """Read a file written by MetricsRecorder.
+
+    Returns the header, and the records as a structured array with one row per
+    recorded step, e.g. records["polarization"]. Records are read up to the last
+    complete one, so files still being written can be read too.
+    """
+    with open(path, "rb") as f:
+        header = json.loads(f.readline())
+        if header["version"] != FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported metrics version {header['version']} "
+                f"(expected {FORMAT_VERSION})."
+            )
+        dtype = np.dtype(
+            [(name, base, tuple(shape)) for name, base, shape in header["fields"]]
+        )
+        data = f.read()
+    return header, np.frombuffer(data[: len(data) - len(data) % dtype.itemsize], dtype)
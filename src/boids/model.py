@@ -1,7 +1,27 @@
+import warnings
 import numpy as np
 from dataclasses import dataclass
+from typing import TYPE_CHECKING
 
-from scipy.spatial import KDTree
+
+from .chunked import ChunkedRules
+from .neighbors import NeighborList, make_neighbor_index, minimum_image
+from .parallel import TiledRules
+from .profiling import NO_PROFILER
+from .topological import TopologicalRules
+
+if TYPE_CHECKING:
+    from .compiled import CompiledRules
+
+# Objects which find a flock's neighbors, and can be queried by flee_predators. The
+# alias is evaluated lazily, so compiled (and numba) need not be imported.
+type NeighborSearch = (
+    NeighborList | TiledRules | CompiledRules | TopologicalRules | ChunkedRules
+)
+
+
+BACKENDS = ("numpy", "numba")
+BOUNDARIES = ("walls", "periodic")
 
 
 @dataclass
@@ -32,17 +52,196 @@ class Flock:
         initial_velocity: np.ndarray | None = None,
         rng: np.random.RandomState | None = None,
         random_seed: int | None = None,
+        seed_sequence: np.random.SeedSequence | None = None,
+        neighbor_index: str = "kdtree",
+        rebuild_interval: int = 1,
+        skin: float = 0,
+        reaction_threshold: float = 0,
+        workers: int = 1,
+        dtype: np.dtype = np.float64,
+        backend: str = "numpy",
+        boundary: str = "walls",
+        n_nearest: int | None = None,
+        chunk_size: int | None = None,
+        force_interval: int = 1,
     ):
-        self.rng = rng or np.random.default_rng(random_seed)
+        """Create a flock.
+
+        Random initial states are drawn from rng, or a generator seeded with
+        random_seed, which is shared by boids and predators. Alternatively, given a
+        seed_sequence, boids and predators each draw from their own stream spawned
+        from it (self.rng and self.predator_rng), so that, e.g., adding predators at
+        different times does not change anything else (see boids.scenario).
+
+        dtype is the floating-point type of the boid and predator state. float32
+        halves the memory and bandwidth used by large flocks, at the cost of
+        trajectories which slowly diverge from float64 (see
+        boids.benchmark.compare_dtypes). Per-boid sums in the flocking rules are
+        always accumulated in float64.
+
+        backend is one of BACKENDS. "numba" evaluates the flocking rules with
+        compiled kernels (see CompiledRules); if numba is not installed, a warning
+        is issued and the NumPy implementation is used instead.
+
+        boundary is one of BOUNDARIES. With "walls", boids are steered away from
+        the barrier margin at the edges of bounds (see avoid_walls). With "periodic",
+        space wraps around at bounds: positions are wrapped on each update, and
+        neighbors and the offsets between agents are taken to the nearest periodic
+        image, so the flock has no edges. Periodic boundaries require the NumPy
+        backend, workers = 1 and rebuild_interval = 1, and radii at most half the
+        width of bounds, or a third with a grid index (or chunk_size). This limit
+        (self.max_radius) is checked whenever view_radius or avoid_radius is set.
+
+        If n_nearest is set, each boid aligns with and coheres to its n_nearest
+        nearest boids, rather than those within view_radius (see TopologicalRules),
+        so the cost of a step does not grow with the density of the flock.
+        view_radius then only applies to predators. Neighbors are found with a
+        KDTree, queried in `workers` threads, and the NumPy backend and
+        rebuild_interval = 1 are required.
+
+        If chunk_size is set, the rules are evaluated over chunks of that many
+        spatially sorted boids (see ChunkedRules), so that the working memory of a
+        step is bounded by the chunk size rather than the total number of neighboring
+        pairs. This always uses a grid of cells to find neighbors, and requires the
+        NumPy backend, workers = 1 and rebuild_interval = 1. Steps are several times
+        slower than unchunked ones at any chunk size, so this is only worthwhile
+        when memory runs out (see boids.benchmark.memory_benchmark).
+
+        If force_interval is more than 1, the neighbor-based rules (avoidance,
+        alignment and cohesion) are only recomputed every force_interval steps, and
+        their acceleration is reused in between; wall avoidance, fleeing predators
+        and the speed limits are still applied on every step (see
+        compute_acceleration). This divides the cost of the rules, which dominates
+        for large flocks, at some cost in accuracy (see
+        boids.benchmark.compare_force_intervals).
+        """
+        self.dtype = np.dtype(dtype)
+        if seed_sequence is not None:
+            if rng is not None or random_seed is not None:
+                raise ValueError(
+                    "seed_sequence cannot be combined with rng or random_seed."
+                )
+            boid_seed, predator_seed = seed_sequence.spawn(2)
+            self.rng = np.random.default_rng(boid_seed)
+            self.predator_rng = np.random.default_rng(predator_seed)
+        else:
+            self.rng = rng or np.random.default_rng(random_seed)
+            self.predator_rng = self.rng
         self.weights = weights or Weights()
         self.min_speed = min_speed
         self.max_speed = max_speed
         self.predator_min_speed = predator_min_speed
         self.predator_max_speed = predator_max_speed
+        # Largest allowed radius, which is only limited by periodic boundaries
+        self.max_radius = np.inf
         self.view_radius = view_radius
         self.avoid_radius = avoid_radius
+        self.iteration = 0
+        self.observers = []
+        self.profiler = NO_PROFILER
+        self.workspace = Workspace()
+        # Candidate neighbor pairs found by the last update, for observers to reuse
+        self.pairs = None
+        if force_interval < 1:
+            raise ValueError("force_interval must be at least 1.")
+        self.force_interval = force_interval
+        # Weighted rule acceleration, kept between updates if force_interval > 1
+        self.rule_acceleration = None
 
         self.init_environment(bounds, barrier_pct)
+        if boundary not in BOUNDARIES:
+            raise ValueError(
+                f"Unknown boundary {boundary!r}, expected one of {BOUNDARIES}."
+            )
+        self.boundary = boundary
+        # Size of the periodic box, or None with walls
+        self.box = None
+        if boundary == "periodic":
+            if (
+                backend != "numpy"
+                or (workers > 1 and n_nearest is None)
+                or rebuild_interval > 1
+            ):
+                raise ValueError(
+                    "Periodic boundaries require the numpy backend, workers = 1 and "
+                    "rebuild_interval = 1."
+                )
+            self.box = self.bounds[self.ndim :].astype(np.float64)
+            # Offsets are taken to the nearest image, so radii can be at most half
+            # the box. A wrapped grid needs 3 cells along each axis (see GridIndex),
+            # which the neighbor list queries at the radius plus the skin.
+            if chunk_size is not None:
+                self.max_radius = self.box.min() / 3
+            elif neighbor_index == "grid":
+                self.max_radius = self.box.min() / 3 - skin
+            else:
+                self.max_radius = self.box.min() / 2
+            self.check_radius(max(view_radius, avoid_radius))
+        self.neighbor_index = make_neighbor_index(
+            neighbor_index, self.bounds, periodic=self.box is not None
+        )
+        self.neighbors = NeighborList(
+            self.neighbor_index, rebuild_interval, skin, reaction_threshold
+        )
+        # Finds boids near predators on steps which reuse the rules
+        self.flee_index = make_neighbor_index(
+            "kdtree", self.bounds, periodic=self.box is not None
+        )
+        self.workers = workers
+        self.backend = backend
+        if backend not in BACKENDS:
+            raise ValueError(
+                f"Unknown backend {backend!r}, expected one of {BACKENDS}."
+            )
+        if backend == "numba":
+            # Imported here, so that numba is only loaded when it is used
+            from . import compiled
+
+            if not compiled.AVAILABLE:
+                warnings.warn(
+                    "numba is not installed, using the NumPy backend instead."
+                )
+                self.backend = "numpy"
+
+        # Finds neighbors and evaluates the rules together, in place of self.neighbors
+        self.fused_rules = None
+        self.n_nearest = n_nearest
+        self.chunk_size = chunk_size
+        if chunk_size is not None:
+            if (
+                backend != "numpy"
+                or workers > 1
+                or rebuild_interval > 1
+                or n_nearest is not None
+            ):
+                raise ValueError(
+                    "Chunked rules require the numpy backend, workers = 1, "
+                    "rebuild_interval = 1 and no n_nearest."
+                )
+            self.fused_rules = ChunkedRules(
+                self.bounds, chunk_size, periodic=self.box is not None
+            )
+        elif n_nearest is not None:
+            if backend != "numpy" or neighbor_index != "kdtree" or rebuild_interval > 1:
+                raise ValueError(
+                    "Nearest neighbors require the numpy backend, the kdtree index "
+                    "and rebuild_interval = 1."
+                )
+            self.fused_rules = TopologicalRules(n_nearest, self.box, workers)
+        elif self.backend == "numba":
+            if workers > 1 or rebuild_interval > 1:
+                raise ValueError(
+                    "The numba backend requires workers = 1 and rebuild_interval = 1."
+                )
+            self.fused_rules = compiled.CompiledRules(self.bounds)
+        elif workers > 1:
+            if rebuild_interval > 1:
+                raise ValueError("workers > 1 requires rebuild_interval = 1.")
+            self.fused_rules = TiledRules(
+                workers,
+                lambda: make_neighbor_index(neighbor_index, self.bounds),
+                flocking_rules,
+            )
         self.init_agents(n_boids, n_predators, initial_position, initial_velocity)
 
     def init_environment(self, bounds: list[int] | None, barrier_pct: float):
@@ -65,38 +264,111 @@ class Flock:
         boid_initial_position: np.ndarray | None,
         boid_initial_velocity: np.ndarray | None,
     ):
-        """Initialise boid and predator position, velocity, and acceleration."""
+        """Initialise boid and predator position, velocity, and acceleration.
+
+        The boid position, velocity and acceleration are views into one contiguous
+        array, self.state, of shape (3, n_boids, ndim).
+        """
         # boid position + velocity
-        self.position = self.init_positions(n_boids, boid_initial_position)
-        self.velocity = self.init_velocity(
+        self.state = np.zeros((3, n_boids, self.ndim), dtype=self.dtype)
+        self.position, self.velocity, self.acceleration = self.state
+        self.position[...] = self.init_positions(n_boids, boid_initial_position)
+        self.velocity[...] = self.init_velocity(
             n_boids, boid_initial_velocity, self.min_speed, self.max_speed
         )
 
         # predator position + velocity
-        self.predator_position = self.init_positions(n_predators, None)
-        self.predator_velocity = self.init_velocity(
-            n_predators, None, self.predator_min_speed, self.predator_max_speed
+        self.predators = PredatorBuffer(
+            self.init_positions(n_predators, None, self.predator_rng),
+            self.init_velocity(
+                n_predators,
+                None,
+                self.predator_min_speed,
+                self.predator_max_speed,
+                self.predator_rng,
+            ),
+            self.dtype,
         )
 
-        # Initialise acceleration arrays, and compute initial values
-        self.acceleration = np.zeros_like(self.velocity)
-        self.predator_acceleration = np.zeros(
-            (n_predators, self.ndim), dtype=np.float64
-        )
+        # Compute initial acceleration
         self.compute_acceleration()
 
+    @property
+    def view_radius(self) -> float:
+        return self._view_radius
+
+    @view_radius.setter
+    def view_radius(self, value: float):
+        self.check_radius(value)
+        self._view_radius = value
+
+    @property
+    def avoid_radius(self) -> float:
+        return self._avoid_radius
+
+    @avoid_radius.setter
+    def avoid_radius(self, value: float):
+        self.check_radius(value)
+        self._avoid_radius = value
+
+    def check_radius(self, radius: float):
+        """Raise a ValueError if radius is larger than self.max_radius."""
+        if radius > self.max_radius:
+            raise ValueError(
+                f"Radius {radius:g} is too large for periodic boundaries, which "
+                "require radii of at most half the bounds, or a third (less the skin) "
+                f"with a grid index or chunk_size: at most {self.max_radius:g} here."
+            )
+
+    @property
+    def predator_position(self) -> np.ndarray:
+        return self.predators.view("position")
+
+    @predator_position.setter
+    def predator_position(self, value: np.ndarray):
+        self.predators.set("position", value)
+
+    @property
+    def predator_velocity(self) -> np.ndarray:
+        return self.predators.view("velocity")
+
+    @predator_velocity.setter
+    def predator_velocity(self, value: np.ndarray):
+        self.predators.set("velocity", value)
+
+    @property
+    def predator_acceleration(self) -> np.ndarray:
+        return self.predators.view("acceleration")
+
+    @predator_acceleration.setter
+    def predator_acceleration(self, value: np.ndarray):
+        self.predators.set("acceleration", value)
+
     def init_positions(
-        self, n_agents: int, initial_position: np.ndarray | None
+        self,
+        n_agents: int,
+        initial_position: np.ndarray | None,
+        rng: np.random.Generator | np.random.RandomState | None = None,
     ) -> np.ndarray:
-        """Generate boid positions within the barrier."""
+        """Generate boid positions within the barrier, of type self.dtype.
+
+        With periodic boundaries there is no barrier, so positions are generated
+        throughout the box. Random positions are drawn from rng (self.rng by
+        default).
+        """
+        rng = rng or self.rng
         if initial_position is not None:
             position = initial_position
+            if self.box is not None:
+                position = wrap(np.array(position, dtype=self.dtype), self.box)
+        elif self.box is not None:
+            position = rng.random(size=(n_agents, self.ndim)) * self.box
         else:
-            normalised_positions = self.rng.random(size=(n_agents, self.ndim))
+            normalised_positions = rng.random(size=(n_agents, self.ndim))
             non_barrier_dims = (1 - 2 * self.barrier_pct) * self.bounds[self.ndim :]
             min_barrier = self.barrier_pct * self.bounds[self.ndim :]
             position = normalised_positions * non_barrier_dims + min_barrier
-        return position
+        return np.asarray(position, dtype=self.dtype)
 
     def init_velocity(
         self,
@@ -104,20 +376,26 @@ class Flock:
         initial_velocity: np.ndarray | None,
         min_speed: float,
         max_speed: float,
+        rng: np.random.Generator | np.random.RandomState | None = None,
     ) -> np.ndarray:
         """Initialise velocity for boids or predators.
 
         Initial velocity is calculated as the combination of an initial speed and
         initial heading. The initial speed is bounded to be within the allowable range.
+        The result is of type self.dtype. Random velocities are drawn from rng
+        (self.rng by default).
         """
+        rng = rng or self.rng
         if initial_velocity is not None:
-            velocity = bound_norm(initial_velocity, min_speed, max_speed)
+            velocity = bound_norm(
+                np.array(initial_velocity, dtype=self.dtype), min_speed, max_speed
+            )
         else:
-            speed = self.rng.random(size=n_agents) * (max_speed - min_speed) + min_speed
-            heading = (self.rng.random(size=(n_agents, self.ndim)) * 2) - 1
+            speed = rng.random(size=n_agents) * (max_speed - min_speed) + min_speed
+            heading = (rng.random(size=(n_agents, self.ndim)) * 2) - 1
             heading /= np.linalg.norm(heading, axis=1)[..., None]
             velocity = heading * speed[..., None]
-        return velocity
+        return velocity.astype(self.dtype, copy=False)
 
     def update(self, step_size: float = 1):
         """Update the velocity and position of all agents, over a given timestep.
@@ -126,26 +404,82 @@ class Flock:
         New position is calculated as: old_position + new_velocity * step_size
 
         Where the velocity is scaled such that the speed falls within the allowable range.
+
+        Velocity and position are updated in place, using scratch arrays from
+        self.workspace for intermediate results, so that the update does not allocate
+        new per-boid arrays each step (beyond those of the neighbor search and rules).
+
+        After the update, each of self.observers is called with the flock (e.g. to
+        record its state). TrajectoryRecorder, MetricsRecorder, Checkpointer and
+        PredatorSchedule add themselves to self.observers when created.
+
+        If self.profiler is set to a PhaseTimer, the time spent in each phase of the
+        update is recorded: integrate, neighbors, rules, walls and predators. It also
+        counts candidate neighbor pairs and boid-predator flee interactions, and keeps
+        a histogram of the number of candidate neighbors per boid.
         """
-        # Update boids
-        self.velocity = bound_norm(
-            self.velocity + self.acceleration * step_size,
-            self.min_speed,
-            self.max_speed,
-        )
-        self.position += self.velocity * step_size
+        with self.profiler.phase("integrate"):
+            # Update boids
+            self.integrate(
+                self.position,
+                self.velocity,
+                self.acceleration,
+                step_size,
+                self.min_speed,
+                self.max_speed,
+                "boid",
+            )
 
-        # Update predators
-        self.predator_velocity = bound_norm(
-            self.predator_velocity + self.predator_acceleration * step_size,
-            self.predator_min_speed,
-            self.predator_max_speed,
+            # Update predators
+            self.integrate(
+                self.predator_position,
+                self.predator_velocity,
+                self.predator_acceleration,
+                step_size,
+                self.predator_min_speed,
+                self.predator_max_speed,
+                "predator",
+            )
+
+        self.compute_acceleration(
+            update_rules=(self.iteration + 1) % self.force_interval == 0
         )
-        self.predator_position += self.predator_velocity * step_size
 
-        self.compute_acceleration()
+        self.iteration += 1
+        for observer in self.observers:
+            observer(self)
+
+    def integrate(
+        self,
+        position: np.ndarray,
+        velocity: np.ndarray,
+        acceleration: np.ndarray,
+        step_size: float,
+        min_speed: float,
+        max_speed: float,
+        name: str,
+    ):
+        """Advance positions and velocities in place, over a given timestep.
+
+        With periodic boundaries, positions are then wrapped into the box. name
+        distinguishes the scratch arrays of each kind of agent.
+        """
+        step = self.workspace.get(f"{name}_step", position.shape, position.dtype)
+        np.multiply(acceleration, step_size, out=step)
+        velocity += step
+        bound_norm(
+            velocity,
+            min_speed,
+            max_speed,
+            work=self.workspace.get(f"{name}_norm", (2, len(velocity)), velocity.dtype),
+            mask=self.workspace.get(f"{name}_moving", (len(velocity),), np.bool_),
+        )
+        np.multiply(velocity, step_size, out=step)
+        position += step
+        if self.box is not None:
+            wrap(position, self.box)
 
-    def compute_acceleration(self):
+    def compute_acceleration(self, update_rules: bool = True):
         """Compute instantaneous acceleration for all agents (boids and predators).
 
         Boid acceleration is a weighted combination of:
@@ -153,76 +487,188 @@ class Flock:
         - Cohesion: toward the center of mass of boids in self.view_radius
         - Alignment: match velocity (speed and heading) of boids in self.view_radius
         - Wall-avoidance: away from walls when margin is within self.avoid_radius
+          (skipped with periodic boundaries)
         - Flee: away from predators within self.view_radius
 
         Predator acceleration is given by the cohesion rule, calculated across all
         boids (effective infinite view_radius).
 
-        A KDTree is used to avoid the poor scaling associated with the naive calculation
-        of nearby birds. This KDTree is rebuilt each time the function is called.
+        A spatial index (self.neighbor_index, a KDTree or uniform grid) is used to
+        avoid the poor scaling associated with the naive calculation of nearby birds.
+        By default the index is rebuilt each time the function is called; see
+        NeighborList for the option to rebuild it only every few iterations. With
+        workers > 1 the environment is instead split into tiles, each indexed and
+        evaluated in parallel (see TiledRules), with the numba backend neighbors
+        are found and evaluated by compiled kernels (see CompiledRules), and with
+        n_nearest set each boid interacts with its nearest boids (see
+        TopologicalRules). With chunk_size set, boids are processed in spatially
+        sorted chunks, to bound memory use (see ChunkedRules).
+
+        The index is queried once for all neighboring pairs within the larger of the
+        two radii, returned as flat index arrays. The avoidance, alignment and cohesion
+        rules are then evaluated for every boid at once (see flocking_rules), rather
+        than boid-by-boid with the calculate_* methods.
+
+        The pairs are kept as self.pairs, so that observers (e.g. MetricsRecorder) can
+        reuse them. They may include pairs further apart than the query radius (see
+        NeighborList). Fused backends don't produce pairs, and set self.pairs to None.
+
+        If update_rules is False and force_interval > 1, the rule acceleration from
+        the last call is reused instead (Flock.update passes False on all but every
+        force_interval-th step). The rules are relative to each boid's own position
+        and velocity, so change slowly while a neighborhood moves together. Wall
+        avoidance and fleeing are still recomputed, with predators' neighbors found
+        in a KDTree of the current positions (self.flee_index), as the rules' index
+        is out of date. self.pairs is then None too.
 
         While its use provides a significant performance increase for large numbers of boids,
-        the KDTree building and lookup still consumes most of the method runtime. A
+        the index building and lookup still consumes most of the method runtime. A
         future direction for performance improvement is described in the README.
         """
-        self.acceleration[:, :] = 0
-        self.predator_acceleration[:, :] = 0
-
-        kdtree = KDTree(self.position)
-
-        too_close = kdtree.query_ball_tree(
-            kdtree,
-            r=self.avoid_radius,
-        )
-        within_sight = kdtree.query_ball_tree(
-            kdtree,
-            r=self.view_radius,
-        )
-        for b in range(len(self)):
-            # Separation
-            avoidance = self.calculate_avoidance(
-                self.position[b], self.position[too_close[b]]
-            )
-            alignment = self.calculate_alignment(
-                self.velocity[b], self.velocity[within_sight[b]]
-            )
-            cohesion = self.calculate_cohesion(
-                self.position[b], self.position[within_sight[b]]
-            )
-
-            self.acceleration[b] = (
-                avoidance * self.weights.separation
-                + alignment * self.weights.alignment
-                + cohesion * self.weights.cohesion
-            )
+        if not update_rules and self.rule_acceleration is not None:
+            self.acceleration[...] = self.rule_acceleration
+            self.pairs = None
+            neighbors = None
+        else:
+            neighbors = self.apply_rules()
+            if self.force_interval > 1:
+                if self.rule_acceleration is None:
+                    self.rule_acceleration = np.empty_like(self.acceleration)
+                self.rule_acceleration[...] = self.acceleration
+
+        if self.box is None:
+            with self.profiler.phase("walls"):
+                self.acceleration += self.avoid_walls(
+                    out=self.workspace.get("walls", self.position.shape, self.dtype)
+                )
 
-        self.acceleration += self.avoid_walls()
+        with self.profiler.phase("predators"):
+            if len(self.predator_position) > 0:
+                self.acceleration += self.flee_predators(neighbors)
 
-        # Add flee affect per predator
-        for p in range(len(self.predator_position)):
-            # Steer toward the center of mass of boids
-            center_of_mass = self.position.mean(axis=0)
-            seek = center_of_mass - self.predator_position[p]
-            self.predator_acceleration[p] = seek * self.weights.predator_seek
+    def apply_rules(
+        self,
+    ) -> NeighborSearch:
+        """Write the weighted avoidance, alignment and cohesion into self.acceleration.
 
-            # Steer each nearby boid away from predator
-            nearby_boids = kdtree.query_ball_point(
-                self.predator_position[p], self.view_radius
-            )
-            if len(nearby_boids) > 0:
-                flee = (self.position[nearby_boids] - self.predator_position[p]).sum(
-                    axis=0
+        Returns the object used to find neighbors, for flee_predators to query.
+        """
+        profiler = self.profiler
+        if self.fused_rules is None:
+            # Neighbors are found first, as the lazy rebuild uses the old acceleration
+            with profiler.phase("neighbors"):
+                i, j = self.neighbors.pairs(
+                    self.position,
+                    self.acceleration,
+                    max(self.view_radius, self.avoid_radius),
                 )
-                flee /= np.linalg.norm(flee)
-                self.acceleration[nearby_boids] += (
-                    flee * self.weights.flee * self.max_speed
+            with profiler.phase("rules"):
+                avoidance, alignment, cohesion = flocking_rules(
+                    self.position,
+                    self.velocity,
+                    i,
+                    j,
+                    self.avoid_radius,
+                    self.view_radius,
+                    box=self.box,
                 )
+            neighbors = self.neighbors
+            self.pairs = (i, j)
+            if profiler.enabled:
+                profiler.count("pairs", len(i))
+                profiler.histogram(
+                    "neighbor_count",
+                    np.bincount(i, minlength=len(self))
+                    + np.bincount(j, minlength=len(self)),
+                )
+        else:
+            with profiler.phase("rules"):
+                avoidance, alignment, cohesion = self.fused_rules(
+                    self.position, self.velocity, self.avoid_radius, self.view_radius
+                )
+            neighbors = self.fused_rules
+            self.pairs = None
+
+        # The rule forces are freshly computed, so are scaled in place
+        np.multiply(avoidance, self.weights.separation, out=self.acceleration)
+        alignment *= self.weights.alignment
+        self.acceleration += alignment
+        cohesion *= self.weights.cohesion
+        self.acceleration += cohesion
+        return neighbors
+
+    def flee_predators(
+        self,
+        neighbors: NeighborSearch | None,
+    ) -> np.ndarray:
+        """Steer predators toward the flock, and compute the boids' flee force.
+
+        Each predator accelerates toward the center of mass of all boids. Each boid
+        within view_radius of a predator is steered away from it, in the direction of
+        the summed offsets of all the boids near that predator. All predators are
+        looked up in a single query. The per-predator sums are accumulated with
+        np.bincount, and the per-boid sums with np.add.at into a scratch array from
+        self.workspace, as only the few boids near a predator are touched. If neighbors
+        is None, boids near predators are found by indexing the current positions in
+        self.flee_index.
+
+        Sets self.predator_acceleration, and returns the flee acceleration of the boids.
+        """
+        n_predators = len(self.predator_position)
+        seek = self.center_of_mass() - self.predator_position
+        if self.box is not None:
+            minimum_image(seek, self.box)
+        self.predator_acceleration = seek * self.weights.predator_seek
+
+        if neighbors is None:
+            self.flee_index.build(self.position)
+            predator_index, boid_index = self.flee_index.query_points(
+                self.predator_position, self.view_radius
+            )
+        else:
+            predator_index, boid_index = neighbors.query_points(
+                self.position, self.predator_position, self.view_radius
+            )
+        self.profiler.count("flee", len(boid_index))
+        offset = self.position[boid_index] - self.predator_position[predator_index]
+        if self.box is not None:
+            minimum_image(offset, self.box)
+        flee = scatter_add(predator_index, offset, n_predators)
+        norm = np.linalg.norm(flee, axis=1, keepdims=True)
+        np.divide(flee, norm, out=flee, where=norm > 0)
+        flee *= self.weights.flee * self.max_speed
+        force = self.workspace.get("flee", self.position.shape, self.dtype)
+        force.fill(0)
+        np.add.at(force, boid_index, flee[predator_index])
+        return force
+
+    def center_of_mass(self) -> np.ndarray:
+        """Mean position of the boids.
+
+        With periodic boundaries, the mean is taken around each axis as a circle (the
+        circular mean), which does not depend on where the box is cut.
+        """
+        if self.box is None:
+            return self.position.mean(axis=0)
+        angle = np.multiply(
+            self.position,
+            2 * np.pi / self.box,
+            out=self.workspace.get("angle", self.position.shape, self.dtype),
+        )
+        trig = self.workspace.get("angle_trig", self.position.shape, self.dtype)
+        mean_angle = np.arctan2(
+            np.sin(angle, out=trig).mean(axis=0), np.cos(angle, out=trig).mean(axis=0)
+        )
+        return np.mod(mean_angle, 2 * np.pi) * (self.box / (2 * np.pi))
 
     def calculate_avoidance(
         self, position: np.ndarray, position_close: np.ndarray
     ) -> np.ndarray:
         """Calculate avoidance force.
 
+        The calculate_* methods give the rules for a single boid, and are kept as the
+        reference definition of the vectorised flocking_rules.
+
         This is calculated by summing vectors directed away from nearby boids.
         """
         return (position - position_close).sum(axis=0)
@@ -263,59 +709,292 @@ class Flock:
             / max(1, (position_close.shape[0] - 1))
         ) - position
 
-    def avoid_walls(self):
+    def avoid_walls(self, out: np.ndarray | None = None) -> np.ndarray:
         """Calculate the wall-avoidance force across all boids in the simulation.
 
         A boid is accelerated away from a wall if the margin on that wall lies within
         the boid avoidance radius. The default margin extends 5% internal to the wall
         bounds. The acceleration away from any given wall is given by the product
         of the maximum boid speed and the wall avoidance weight.
-        """
-        nudge = np.zeros_like(self.acceleration)
-        for dim in range(self.ndim):
-            exit_left = (
-                self.position[:, dim] - self.avoid_radius < self.barrier_bounds[dim]
-            )
-            exit_right = (
-                self.position[:, dim] + self.avoid_radius
-                > self.barrier_bounds[self.ndim + dim]
-            )
-            nudge[exit_left, dim] = 1
-            nudge[exit_right, dim] = -1
 
-        return nudge * self.max_speed * self.weights.containment
+        The force is written into out, if given.
+        """
+        nudge = wall_nudge(
+            self.position,
+            self.barrier_bounds,
+            self.avoid_radius,
+            out=out,
+            mask=self.workspace.get("walls_mask", (2, len(self)), dtype=np.bool_),
+        )
+        nudge *= self.max_speed * self.weights.containment
+        return nudge
 
     def add_predator(self):
         """Adds a predator to the system with random initial position and velocity."""
-        position = self.init_positions(1, None)
+        position = self.init_positions(1, None, self.predator_rng)
         velocity = self.init_velocity(
-            1, None, self.predator_min_speed, self.predator_max_speed
-        )
-        acceleration = np.zeros((1, self.ndim), dtype=np.float64)
-        self.predator_position = np.vstack([self.predator_position, position])
-        self.predator_velocity = np.vstack([self.predator_velocity, velocity])
-        self.predator_acceleration = np.vstack(
-            [self.predator_acceleration, acceleration]
+            1,
+            None,
+            self.predator_min_speed,
+            self.predator_max_speed,
+            self.predator_rng,
         )
+        self.predators.append(position[0], velocity[0])
 
     def remove_oldest_predator(self):
         """Removes the predator in index 0 from the system.
 
         If no predators exist, this method has no effect.
         """
-        self.predator_position = self.predator_position[1:]
-        self.predator_velocity = self.predator_velocity[1:]
-        self.predator_acceleration = self.predator_acceleration[1:]
+        self.predators.remove_oldest()
 
     def __len__(self) -> int:
         return len(self.position)
 
 
-def bound_norm(vec: np.ndarray, min_norm: float, max_norm: float) -> np.ndarray:
-    """Scales a vector such that its norm is within an allowable range."""
-    norm = np.linalg.norm(vec, axis=1)
-    too_high = norm > max_norm
-    too_low = norm < min_norm
-    vec[too_high] = (vec[too_high] / norm[too_high, None]) * max_norm
-    vec[too_low] = (vec[too_low] / norm[too_low, None]) * min_norm
+class PredatorBuffer:
+    """Predator position, velocity and acceleration, stored with spare capacity.
+
+    Predators are kept in order of age, in rows start:start + count of buffers which
+    may hold more rows than are in use. view() gives those rows of a field, which
+    stay valid until a predator is added or removed, and set() copies an array of
+    the same shape into them.
+
+    Removing the oldest predator just advances start. Adding a predator fills the
+    next spare row, first moving the predators to the front of the buffer, or
+    doubling its capacity, if the end of the buffer has been reached. Both are
+    amortised O(1), rather than reallocating every array on each change.
+    """
+
+    FIELDS = ("position", "velocity", "acceleration")
+
+    def __init__(
+        self, position: np.ndarray, velocity: np.ndarray, dtype: np.dtype = np.float64
+    ):
+        count, ndim = position.shape
+        self.buffers = {
+            field: np.zeros((max(count, 4), ndim), dtype=dtype) for field in self.FIELDS
+        }
+        self.start = 0
+        self.count = count
+        self.set("position", position)
+        self.set("velocity", velocity)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def view(self, field: str) -> np.ndarray:
+        return self.buffers[field][self.start : self.start + self.count]
+
+    def set(self, field: str, value: np.ndarray):
+        view = self.view(field)
+        if np.shape(value) != view.shape:
+            raise ValueError(
+                f"Expected predator {field} of shape {view.shape}, "
+                f"got {np.shape(value)}."
+            )
+        view[...] = value
+
+    @property
+    def capacity(self) -> int:
+        return len(self.buffers["position"])
+
+    def append(self, position: np.ndarray, velocity: np.ndarray):
+        """Add a predator, with zero acceleration."""
+        if self.start + self.count == self.capacity:
+            if 2 * self.count <= self.capacity:
+                # Plenty of space freed at the front, so move the predators there
+                for buffer in self.buffers.values():
+                    buffer[: self.count] = buffer[self.start : self.start + self.count]
+            else:
+                for field, buffer in self.buffers.items():
+                    grown = np.zeros(
+                        (2 * self.capacity, buffer.shape[1]), dtype=buffer.dtype
+                    )
+                    grown[: self.count] = buffer[self.start : self.start + self.count]
+                    self.buffers[field] = grown
+            self.start = 0
+
+        row = self.start + self.count
+        self.buffers["position"][row] = position
+        self.buffers["velocity"][row] = velocity
+        self.buffers["acceleration"][row] = 0
+        self.count += 1
+
+    def remove_oldest(self):
+        """Remove the oldest predator, if there are any."""
+        if self.count > 0:
+            self.start += 1
+            self.count -= 1
+
+
+class Workspace:
+    """Named scratch arrays, reused from step to step.
+
+    An array is only allocated on first use, or if the requested shape or dtype
+    changes (e.g. when predators are added).
+    """
+
+    def __init__(self):
+        self.arrays = {}
+
+    def get(
+        self, name: str, shape: tuple[int, ...], dtype: np.dtype = np.float64
+    ) -> np.ndarray:
+        array = self.arrays.get(name)
+        if array is None or array.shape != shape or array.dtype != dtype:
+            array = self.arrays[name] = np.empty(shape, dtype=dtype)
+        return array
+
+
+def bound_norm(
+    vec: np.ndarray,
+    min_norm: float | np.ndarray,
+    max_norm: float | np.ndarray,
+    work: np.ndarray | None = None,
+    mask: np.ndarray | None = None,
+) -> np.ndarray:
+    """Scales a vector such that its norm is within an allowable range.
+
+    The bounds may be scalars, or arrays giving the bounds for each row of vec. Each
+    row is scaled in place by clip(norm, min_norm, max_norm) / norm, computed in the
+    dtype of vec. Rows with zero norm have no direction, so are left unchanged. work
+    (of shape (2, len(vec))) and mask (a boolean array of length len(vec)) are
+    optional scratch arrays, to avoid allocating.
+    """
+    if work is None:
+        work = np.empty((2, len(vec)), dtype=vec.dtype)
+    if mask is None:
+        mask = np.empty(len(vec), dtype=np.bool_)
+    norm, scale = work
+    np.einsum("ij,ij->i", vec, vec, out=norm)
+    np.sqrt(norm, out=norm)
+    np.clip(norm, min_norm, max_norm, out=scale)
+    np.greater(norm, 0, out=mask)
+    np.divide(scale, norm, out=scale, where=mask)
+    # Column by column, as broadcasting scale over rows would buffer
+    for column in vec.T:
+        column *= scale
     return vec
+
+
+def wall_nudge(
+    position: np.ndarray,
+    barrier_bounds: np.ndarray,
+    avoid_radius: float | np.ndarray,
+    out: np.ndarray | None = None,
+    mask: np.ndarray | None = None,
+) -> np.ndarray:
+    """Direction (-1, 0 or 1 per dimension) in which to push agents off the walls.
+
+    An agent is pushed away from a wall if the margin on that wall lies within
+    avoid_radius. Positions may have any leading shape, with the last axis the
+    spatial dimension; avoid_radius must broadcast against position[..., 0].
+
+    out (shaped like position) and mask (a boolean array of shape
+    (2, *position.shape[:-1])) are optional scratch arrays, to avoid allocating.
+    """
+    ndim = position.shape[-1]
+    nudge = np.zeros_like(position) if out is None else out
+    nudge[...] = 0
+    if mask is None:
+        mask = np.empty((2, *position.shape[:-1]), dtype=np.bool_)
+    exit_left, exit_right = mask
+    for dim in range(ndim):
+        np.less(position[..., dim], barrier_bounds[dim] + avoid_radius, out=exit_left)
+        np.greater(
+            position[..., dim],
+            barrier_bounds[ndim + dim] - avoid_radius,
+            out=exit_right,
+        )
+        np.copyto(nudge[..., dim], 1, where=exit_left)
+        np.copyto(nudge[..., dim], -1, where=exit_right)
+    return nudge
+
+
+def flocking_rules(
+    position: np.ndarray,
+    velocity: np.ndarray,
+    i: np.ndarray,
+    j: np.ndarray,
+    avoid_radius: float,
+    view_radius: float,
+    box: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Compute the avoidance, alignment and cohesion forces for all boids at once.
+
+    Neighbors are given as an unordered list of candidate pairs (i[k], j[k]), each
+    appearing once and excluding self-pairs. Pairs further apart than a rule's radius
+    are ignored by that rule, so the candidates may be a superset of the true
+    neighbors. Per-boid sums are accumulated in both directions of each pair with
+    np.bincount.
+
+    The results match Flock.calculate_avoidance, Flock.calculate_alignment and
+    Flock.calculate_cohesion applied to each boid, up to floating-point rounding.
+
+    If box is given, space is periodic with that size: offsets between boids are
+    taken to the nearest periodic image, and cohesion is computed from the mean
+    offset to the neighbors, as their mean position is not well defined. (It is
+    then zero for boids without neighbors, rather than pulling them to the origin.)
+    """
+    n_boids = position.shape[0]
+    offset = position[i] - position[j]
+    if box is not None:
+        minimum_image(offset, box)
+    dist_sq = np.einsum("ij,ij->i", offset, offset)
+    close = dist_sq <= avoid_radius**2
+    sight = dist_sq <= view_radius**2
+
+    avoidance = scatter_sum(i[close], j[close], offset[close], -offset[close], n_boids)
+
+    i_sight, j_sight = i[sight], j[sight]
+    n_neighbors = np.bincount(i_sight, minlength=n_boids) + np.bincount(
+        j_sight, minlength=n_boids
+    )
+    denominator = np.maximum(1, n_neighbors)[:, None]
+    velocity_sum = scatter_sum(
+        i_sight, j_sight, velocity[j_sight], velocity[i_sight], n_boids
+    )
+    alignment = velocity_sum / denominator - velocity
+    if box is None:
+        position_sum = scatter_sum(
+            i_sight, j_sight, position[j_sight], position[i_sight], n_boids
+        )
+        cohesion = position_sum / denominator - position
+    else:
+        offset_sight = offset[sight]
+        offset_sum = scatter_sum(i_sight, j_sight, -offset_sight, offset_sight, n_boids)
+        cohesion = offset_sum / denominator
+    return avoidance, alignment, cohesion
+
+
+def wrap(position: np.ndarray, box: np.ndarray) -> np.ndarray:
+    """Wrap positions in place into a periodic box, [0, box) along each axis."""
+    np.mod(position, box, out=position)
+    # The remainder of a tiny negative position can round up to box itself
+    np.subtract(position, box, out=position, where=position >= box)
+    return position
+
+
+def scatter_sum(
+    i: np.ndarray,
+    j: np.ndarray,
+    values_i: np.ndarray,
+    values_j: np.ndarray,
+    n_agents: int,
+) -> np.ndarray:
+    """Sum pair values onto both members of each pair.
+
+    Row k of values_i is added to agent i[k], and row k of values_j to agent j[k].
+    """
+    return scatter_add(
+        np.concatenate([i, j]), np.concatenate([values_i, values_j]), n_agents
+    )
+
+
+def scatter_add(index: np.ndarray, values: np.ndarray, n_agents: int) -> np.ndarray:
+    """Sum rows of values by agent, where row k belongs to agent index[k]."""
+    total = np.empty((n_agents, values.shape[1]), dtype=np.float64)
+    for dim in range(values.shape[1]):
+        total[:, dim] = np.bincount(index, weights=values[:, dim], minlength=n_agents)
+    return total
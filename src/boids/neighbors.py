@@ -0,0 +1,472 @@
+import itertools
+from dataclasses import dataclass
+
+import numpy as np
+from scipy.spatial import KDTree
+
+NEIGHBOR_INDEXES = ("kdtree", "grid")
+
+
+class NeighborIndex:
+    """Base class for the spatial index used to find nearby agents.
+
+    The index is built once per step from the boid positions, after which it answers
+    two kinds of query: all pairs of boids within some radius of each other, and all
+    boids within some radius of a set of arbitrary points (e.g. predators). Both
+    queries return flat index arrays, which can be consumed without a Python loop.
+    """
+
+    def build(self, position: np.ndarray):
+        """Index a new set of positions, replacing any previous state.
+
+        The index may keep a reference to position, which must not be modified
+        while the index is in use.
+        """
+        raise NotImplementedError
+
+    def query_pairs(self, radius: float) -> tuple[np.ndarray, np.ndarray]:
+        """Find all pairs of boids within radius of each other.
+
+        Returns index arrays (i, j). Each pair appears once, and self-pairs are
+        excluded.
+        """
+        raise NotImplementedError
+
+    def query_points(
+        self, points: np.ndarray, radius: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Find all boids within radius of each of the given points.
+
+        Returns index arrays (point_index, boid_index), with one entry per match.
+        """
+        raise NotImplementedError
+
+    def query_pairs_of(
+        self, subset: np.ndarray, radius: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Find all pairs of boids within radius with at least one boid in subset.
+
+        subset is a boolean mask over the boids. Returns index arrays (i, j), as for
+        query_pairs. By default all pairs are found and filtered; indexes which can
+        visit only the subset's neighbors override this.
+        """
+        i, j = self.query_pairs(radius)
+        keep = subset[i] | subset[j]
+        return i[keep], j[keep]
+
+
+class KDTreeIndex(NeighborIndex):
+    """Neighbor index backed by scipy's KDTree.
+
+    If boxsize is given, the space is periodic: positions must lie in [0, boxsize),
+    and distances are measured to the nearest periodic image.
+    """
+
+    name = "kdtree"
+
+    def __init__(self, boxsize: np.ndarray | None = None):
+        self.boxsize = boxsize
+
+    def build(self, position: np.ndarray):
+        self.tree = KDTree(position, boxsize=self.boxsize)
+
+    def query_pairs(self, radius: float) -> tuple[np.ndarray, np.ndarray]:
+        i, j = self.tree.query_pairs(r=radius, output_type="ndarray").T
+        return i, j
+
+    def query_points(
+        self, points: np.ndarray, radius: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if len(points) == 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+        nearby = self.tree.query_ball_point(points, radius)
+        counts = np.fromiter(map(len, nearby), dtype=np.intp, count=len(nearby))
+        point_index = np.repeat(np.arange(len(points)), counts)
+        boid_index = np.fromiter(
+            itertools.chain.from_iterable(nearby), dtype=np.intp, count=counts.sum()
+        )
+        return point_index, boid_index
+
+
+class GridIndex(NeighborIndex):
+    """Neighbor index backed by a uniform grid of cells (a cell list).
+
+    The environment bounds are divided into cells at least as wide as the query
+    radius, so any neighbor of a boid lies in the same or an adjacent cell. Boids are
+    sorted by cell ID, which for up to 2**16 cells is a linear-time radix sort. Boids
+    outside the bounds are assigned to the nearest edge cell.
+
+    Cell lists are built lazily for the query radii, and cached until the next call
+    to build (see cell_list). Flock queries pairs once, at the larger of its two
+    radii, so the avoidance radius does not need a separate pass.
+
+    If periodic is set, the grid wraps around at the bounds, and distances are
+    measured to the nearest periodic image. This needs at least 3 cells along each
+    axis, so that the stencil around a cell never visits the same cell twice.
+    """
+
+    name = "grid"
+
+    MAX_CELLS = 2**16
+
+    def __init__(self, bounds: np.ndarray, periodic: bool = False):
+        self.ndim = len(bounds) // 2
+        self.lower = np.asarray(bounds[: self.ndim], dtype=np.float64)
+        self.extent = np.asarray(bounds[self.ndim :], dtype=np.float64) - self.lower
+        self.periodic = periodic
+        self.max_cells_per_dim = int(self.MAX_CELLS ** (1 / self.ndim))
+        stencil = list(itertools.product((-1, 0, 1), repeat=self.ndim))
+        self.full_stencil = [np.array(offset) for offset in stencil]
+        self.half_stencil = [
+            np.array(offset) for offset in stencil if offset > (0,) * self.ndim
+        ]
+
+    def build(self, position: np.ndarray):
+        self.position = position
+        self.cell_lists = []
+
+    def query_pairs(self, radius: float) -> tuple[np.ndarray, np.ndarray]:
+        cells = self.cell_list(radius)
+        coords = cells.coords[cells.order]
+
+        # Work in cell order, so that neighboring boids are close together in memory.
+        # Pairs within a cell are taken once, in sorted order.
+        i, j = cells.candidates(coords, np.zeros(self.ndim, dtype=np.intp))
+        i, j = self.within(cells.sorted_position, i, j, radius, i < j)
+        pairs_i, pairs_j = [i], [j]
+
+        # Pairs across cells are taken once, from the cell earlier in the stencil
+        for offset in self.half_stencil:
+            i, j = cells.candidates(coords, offset)
+            i, j = self.within(cells.sorted_position, i, j, radius)
+            pairs_i.append(i)
+            pairs_j.append(j)
+        return (
+            cells.order[np.concatenate(pairs_i)],
+            cells.order[np.concatenate(pairs_j)],
+        )
+
+    def query_points(
+        self, points: np.ndarray, radius: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if len(points) == 0:
+            return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+        cells = self.cell_list(radius)
+        coords = cells.cell_coords(points)
+        point_index, boid_index = [], []
+        for offset in self.full_stencil:
+            p, b = cells.candidates(coords, offset)
+            separation = self.separation(cells.sorted_position[b], points[p])
+            keep = np.einsum("ij,ij->i", separation, separation) <= radius**2
+            point_index.append(p[keep])
+            boid_index.append(cells.order[b[keep]])
+        return np.concatenate(point_index), np.concatenate(boid_index)
+
+    def query_pairs_of(
+        self, subset: np.ndarray, radius: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if subset.all():
+            return self.query_pairs(radius)
+        # The stencil of a cell is larger than the subset's own halo, so the subset is
+        # queried as points rather than enumerating every pair of the grid
+        members = np.flatnonzero(subset)
+        point_index, j = self.query_points(self.position[members], radius)
+        i = members[point_index]
+        # Pairs within the subset are found from both ends, so keep one of each
+        keep = ~subset[j] | (i < j)
+        return i[keep], j[keep]
+
+    def cell_list(self, radius: float) -> "CellList":
+        """Sort boids into cells at least as wide as radius, caching the result.
+
+        The finest cached cell list whose cells are wide enough is reused, so
+        queries at slightly larger radii (e.g. widened by NeighborList for drift)
+        share the cells of the first query. Besides the first cell list of each
+        build, only the most recent is kept.
+        """
+        shape = np.clip(self.extent // radius, 1, self.max_cells_per_dim).astype(
+            np.intp
+        )
+        wide_enough = [
+            cells for cells in self.cell_lists if np.all(cells.shape <= shape)
+        ]
+        if wide_enough:
+            return max(wide_enough, key=lambda cells: np.prod(cells.shape))
+        if self.periodic and np.any(shape < 3):
+            raise ValueError(
+                "A periodic grid must be at least 3 query radii wide "
+                f"(radius {radius}, extent {self.extent.tolist()})."
+            )
+        cells = CellList(self.position, self.lower, self.extent, shape, self.periodic)
+        self.cell_lists = [*self.cell_lists[:1], cells]
+        return cells
+
+    def within(
+        self,
+        position: np.ndarray,
+        i: np.ndarray,
+        j: np.ndarray,
+        radius: float,
+        keep: np.ndarray | bool = True,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Filter candidate pairs to those within radius of each other."""
+        separation = self.separation(position[i], position[j])
+        keep = keep & (np.einsum("ij,ij->i", separation, separation) <= radius**2)
+        return i[keep], j[keep]
+
+    def separation(self, a: np.ndarray, b: np.ndarray) -> np.ndarray:
+        """a - b, taken to the nearest periodic image if the grid is periodic."""
+        separation = a - b
+        if self.periodic:
+            minimum_image(separation, self.extent)
+        return separation
+
+
+class CellList:
+    """Boids sorted by the grid cell containing them.
+
+    Boids in cell c are order[start[c] : start[c] + count[c]], and sorted_position
+    holds their positions in this order. If periodic, neighboring cells wrap around
+    the edges of the grid.
+    """
+
+    def __init__(
+        self,
+        position: np.ndarray,
+        lower: np.ndarray,
+        extent: np.ndarray,
+        shape: np.ndarray,
+        periodic: bool = False,
+    ):
+        self.lower = lower
+        self.extent = extent
+        self.shape = shape
+        self.periodic = periodic
+        self.coords = self.cell_coords(position)
+        cell_id = np.ravel_multi_index(tuple(self.coords.T), shape)
+        self.count = np.bincount(cell_id, minlength=np.prod(shape))
+        self.start = np.cumsum(self.count) - self.count
+        self.order = np.argsort(cell_id.astype(np.uint16), kind="stable")
+        self.sorted_position = position[self.order]
+
+    def cell_coords(self, points: np.ndarray) -> np.ndarray:
+        """Integer cell coordinates of each point, clipped to the grid."""
+        coords = np.floor((points - self.lower) / self.extent * self.shape)
+        return np.clip(coords, 0, self.shape - 1).astype(np.intp)
+
+    def candidates(
+        self, coords: np.ndarray, offset: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Pair each source with every boid in the cell at the given offset from it.
+
+        Sources are given by their cell coordinates. Returns index arrays
+        (source_index, rank), where rank is the position of the boid in the sorted
+        order. Offsets which fall outside the grid are skipped, unless it is periodic.
+        """
+        neighbor_coords = coords + offset
+        if self.periodic:
+            source = np.arange(len(coords))
+            neighbor_cell = np.ravel_multi_index(
+                tuple(neighbor_coords.T), self.shape, mode="wrap"
+            )
+        else:
+            valid = np.all(
+                (neighbor_coords >= 0) & (neighbor_coords < self.shape), axis=1
+            )
+            source = np.flatnonzero(valid)
+            neighbor_cell = np.ravel_multi_index(
+                tuple(neighbor_coords[valid].T), self.shape
+            )
+
+        n_candidates = self.count[neighbor_cell]
+        source_index = np.repeat(source, n_candidates)
+        first = np.cumsum(n_candidates) - n_candidates
+        rank = np.arange(source_index.size) - np.repeat(first, n_candidates)
+        rank += np.repeat(self.start[neighbor_cell], n_candidates)
+        return source_index, rank
+
+
+@dataclass
+class RebuildCounters:
+    """Counts of the paths taken by NeighborList.
+
+    full: steps on which the index was rebuilt from scratch
+    partial: steps on which only some boids had their neighbors refreshed
+    reused: steps on which the cached pairs were reused unchanged
+    refreshed: total number of boids refreshed across all partial steps
+    """
+
+    full: int = 0
+    partial: int = 0
+    reused: int = 0
+    refreshed: int = 0
+
+
+class NeighborList:
+    """Cache of neighboring pairs, rebuilt in full only every few steps.
+
+    This implements the "reaction time" approximation described in the README. On a
+    full rebuild the index is built from the current positions, and all pairs within
+    the query radius plus a skin distance are cached (a Verlet list). In between full
+    rebuilds, a boid has its cached pairs refreshed only if it has moved more than
+    half the skin distance since it was last refreshed, and the norm of its
+    acceleration exceeds reaction_threshold. All other boids reuse their cached pairs,
+    which are still filtered by the true distance in flocking_rules.
+
+    With rebuild_interval=1 (the default) the index is rebuilt on every step, which
+    is exact. With reaction_threshold=0, neighbors are missed only when two boids
+    both drift close to half the skin distance, so a larger skin trades pair-count
+    for accuracy. Larger thresholds and intervals trade accuracy for throughput. If
+    more than MAX_REFRESH_FRACTION of boids need refreshing, a full rebuild is done
+    instead, as it is cheaper.
+    """
+
+    MAX_REFRESH_FRACTION = 0.25
+
+    def __init__(
+        self,
+        index: NeighborIndex,
+        rebuild_interval: int = 1,
+        skin: float = 0,
+        reaction_threshold: float = 0,
+    ):
+        if rebuild_interval < 1:
+            raise ValueError("rebuild_interval must be at least 1.")
+        self.index = index
+        self.rebuild_interval = rebuild_interval
+        self.skin = skin
+        self.reaction_threshold = reaction_threshold
+        self.counters = RebuildCounters()
+        self.cutoff = None
+        self.steps_since_rebuild = 0
+
+    def pairs(
+        self, position: np.ndarray, acceleration: np.ndarray, radius: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Candidate pairs of boids within radius of each other.
+
+        The result may include pairs up to radius + skin apart, so callers must filter
+        by distance.
+        """
+        cutoff = radius + self.skin
+        if (
+            cutoff != self.cutoff
+            or self.steps_since_rebuild + 1 >= self.rebuild_interval
+            or len(position) != len(self.built_position)
+        ):
+            self.rebuild(position, cutoff)
+        else:
+            self.steps_since_rebuild += 1
+            self.refresh(position, acceleration)
+        return self.i, self.j
+
+    def rebuild(self, position: np.ndarray, cutoff: float):
+        """Rebuild the index, and all cached pairs, from the current positions."""
+        # Indexes may keep a reference to the positions they were built from, which
+        # Flock updates in-place
+        self.built_position = position.copy()
+        self.refreshed_position = self.built_position.copy()
+        self.index.build(self.built_position)
+        self.i, self.j = self.index.query_pairs(cutoff)
+        self.cutoff = cutoff
+        self.steps_since_rebuild = 0
+        self.counters.full += 1
+
+    def refresh(self, position: np.ndarray, acceleration: np.ndarray):
+        """Recompute cached pairs for reacting boids which have moved too far."""
+        drift = np.linalg.norm(position - self.refreshed_position, axis=1)
+        stale = drift > self.skin / 2
+        if self.reaction_threshold > 0:
+            stale &= np.linalg.norm(acceleration, axis=1) > self.reaction_threshold
+        if not stale.any():
+            self.counters.reused += 1
+            return
+        if stale.mean() > self.MAX_REFRESH_FRACTION:
+            # Refreshing most boids individually is slower than a full rebuild
+            self.rebuild(position, self.cutoff)
+            return
+
+        keep = ~(stale[self.i] | stale[self.j])
+        refreshed = np.flatnonzero(stale)
+        point_index, boid_index = self.query_points(
+            position, position[refreshed], self.cutoff
+        )
+        a = refreshed[point_index]
+        # Pairs between two refreshed boids are found from both ends; keep one
+        new = (a != boid_index) & (~stale[boid_index] | (a < boid_index))
+        self.i = np.concatenate([self.i[keep], a[new]])
+        self.j = np.concatenate([self.j[keep], boid_index[new]])
+        self.refreshed_position[refreshed] = position[refreshed]
+        self.counters.partial += 1
+        self.counters.refreshed += len(refreshed)
+
+    def get_state(self) -> dict:
+        """The cached pairs and reference positions, e.g. for a checkpoint."""
+        if self.cutoff is None:
+            return {}
+        return {
+            "cutoff": self.cutoff,
+            "steps_since_rebuild": self.steps_since_rebuild,
+            "built_position": self.built_position,
+            "refreshed_position": self.refreshed_position,
+            "i": self.i,
+            "j": self.j,
+        }
+
+    def set_state(self, state: dict):
+        """Restore a cache saved with get_state, rebuilding the index to match it."""
+        if not state:
+            self.cutoff = None
+            return
+        self.cutoff = float(state["cutoff"])
+        self.steps_since_rebuild = int(state["steps_since_rebuild"])
+        self.built_position = np.array(state["built_position"])
+        self.refreshed_position = np.array(state["refreshed_position"])
+        self.i = np.array(state["i"])
+        self.j = np.array(state["j"])
+        self.index.build(self.built_position)
+
+    def query_points(
+        self, position: np.ndarray, points: np.ndarray, radius: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Find all boids currently within radius of each of the given points.
+
+        The index may be out of date, so it is searched with the radius extended by
+        the furthest any boid has moved since it was built, and the results are then
+        filtered by the current positions.
+        """
+        if self.steps_since_rebuild == 0:
+            return self.index.query_points(points, radius)
+        max_drift = np.linalg.norm(position - self.built_position, axis=1).max()
+        point_index, boid_index = self.index.query_points(points, radius + max_drift)
+        separation = position[boid_index] - points[point_index]
+        keep = np.einsum("ij,ij->i", separation, separation) <= radius**2
+        return point_index[keep], boid_index[keep]
+
+
+def make_neighbor_index(
+    name: str, bounds: np.ndarray, periodic: bool = False
+) -> NeighborIndex:
+    """Create the neighbor index with the given name (one of NEIGHBOR_INDEXES).
+
+    If periodic is set, the space wraps around at bounds, whose lower corner must be
+    the origin.
+    """
+    if name == "kdtree":
+        return KDTreeIndex(bounds[len(bounds) // 2 :] if periodic else None)
+    elif name == "grid":
+        return GridIndex(bounds, periodic)
+    else:
+        raise ValueError(
+            f"Unknown neighbor index {name!r}, expected one of {NEIGHBOR_INDEXES}."
+        )
+
+
+def minimum_image(separation: np.ndarray, box: np.ndarray) -> np.ndarray:
+    """Wrap separations in place to those between the nearest periodic images.
+
+    Each component is brought into [-box / 2, box / 2], for a periodic box of the
+    given size along each axis.
+    """
+    separation -= box * np.round(separation / box)
+    return separation
@@ -0,0 +1,73 @@
+import math
+
+from .profiling import FrameStats
+
+
+class AdaptivePacer:
+    """Chooses a framerate and number of simulation sub-steps to hold real time.
+
+    Each frame advances the simulation by 1 / fps seconds, in sub-steps no longer
+    than max_step_size, so the flock dynamics are the same at any framerate. Given
+    the measured cost of a simulation step and of rendering a frame, the pacer picks
+    the highest framerate (up to max_fps) whose frames can be computed in time,
+    leaving a fraction of each frame spare as headroom.
+
+    If no framerate down to min_fps keeps up, min_fps is used, and the simulation
+    runs slower than real time rather than taking longer steps.
+    """
+
+    def __init__(
+        self,
+        max_fps: float = 60,
+        min_fps: float = 10,
+        max_step_size: float = 1 / 30,
+        headroom: float = 0.2,
+        update_frames: int = 30,
+        tolerance: float = 0.1,
+    ):
+        self.max_fps = max_fps
+        self.min_fps = min_fps
+        self.max_step_size = max_step_size
+        self.headroom = headroom
+        self.update_frames = update_frames
+        self.tolerance = tolerance
+        self.frames = 0
+        self.set_fps(max_fps)
+
+    def set_fps(self, fps: float):
+        self.fps = fps
+        self.substeps = self.substeps_for(fps)
+        self.step_size = 1 / (fps * self.substeps)
+
+    def substeps_for(self, fps: float) -> int:
+        """Fewest steps per frame which keep each step within max_step_size."""
+        return max(1, math.ceil(1 / (fps * self.max_step_size) - 1e-9))
+
+    def frame_cost(self, fps: float, stats: FrameStats) -> float:
+        """Estimated seconds needed to simulate and render one frame at fps."""
+        return (self.substeps_for(fps) * stats.sim_ms + stats.render_ms) / 1000
+
+    def best_fps(self, stats: FrameStats) -> float:
+        """Highest whole framerate whose frames fit in time, or min_fps if none do."""
+        fps = math.floor(self.max_fps)
+        while fps > self.min_fps:
+            if self.frame_cost(fps, stats) <= (1 - self.headroom) / fps:
+                return fps
+            fps -= 1
+        return self.min_fps
+
+    def update(self, stats: FrameStats) -> bool:
+        """Called once per frame; returns True if the framerate has changed.
+
+        The framerate is only reconsidered every update_frames frames, and is only
+        changed if the new choice differs by more than the tolerance, so that noisy
+        timings don't make it oscillate.
+        """
+        self.frames += 1
+        if self.frames % self.update_frames != 0:
+            return False
+        fps = self.best_fps(stats)
+        if abs(fps - self.fps) <= self.tolerance * self.fps:
+            return False
+        self.set_fps(fps)
+        return True
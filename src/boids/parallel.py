@@ -0,0 +1,143 @@
+import math
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .neighbors import NeighborIndex
+
+
+class Tile:
+    """The boids making up one tile and its halo, and their index.
+
+    members are the indices of the boids in the tile, and owned is a mask over
+    members of the boids in the tile itself (excluding the halo).
+    """
+
+    def __init__(self, members: np.ndarray, owned: np.ndarray, index: NeighborIndex):
+        self.members = members
+        self.owned = owned
+        self.index = index
+
+
+class TiledRules:
+    """Evaluates the flocking rules in parallel, over tiles of the environment.
+
+    Boids are divided into a grid of tiles over the first two axes: first into
+    columns along the first axis, then each column into tiles along the second, with
+    boundaries at quantiles of their positions so that each tile holds a similar
+    number of boids. Tiling in two dimensions keeps the halos small relative to the
+    tiles as the number of workers grows, and tiles are never made narrower than the
+    query radius (so there may be fewer tiles than workers for small environments).
+
+    Each tile indexes the boids in it plus a halo of boids within the query radius
+    of it, which contains every neighbor of the tile's own boids. Only pairs with at
+    least one of the tile's own boids are evaluated (see
+    NeighborIndex.query_pairs_of), and the rules are kept only for the tile's own
+    boids. Every boid is thus computed by exactly one tile.
+
+    Tiles run in a thread pool, sharing the position and velocity arrays without
+    copying them between processes (the KDTree, and most NumPy operations, release
+    the GIL). The tiling is a pure function of the positions, so results are
+    deterministic, and match the serial computation up to floating-point rounding
+    (sums are accumulated in a different order).
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        make_index: Callable[[], NeighborIndex],
+        rules: Callable,
+    ):
+        self.workers = workers
+        self.make_index = make_index
+        self.rules = rules
+        self.pool = ThreadPoolExecutor(workers)
+        self.tiles = []
+
+    def __call__(
+        self,
+        position: np.ndarray,
+        velocity: np.ndarray,
+        avoid_radius: float,
+        view_radius: float,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Compute (avoidance, alignment, cohesion), as for flocking_rules."""
+        radius = max(avoid_radius, view_radius)
+        forces = [np.empty_like(position, dtype=np.float64) for _ in range(3)]
+
+        def compute_tile(lower: np.ndarray, upper: np.ndarray) -> Tile:
+            corner = position[:, : len(lower)]
+            members = np.flatnonzero(
+                np.all((corner >= lower - radius) & (corner < upper + radius), axis=1)
+            )
+            owned = np.all(
+                (corner[members] >= lower) & (corner[members] < upper), axis=1
+            )
+            tile = Tile(members, owned, self.make_index())
+
+            tile_position = position[members]
+            tile.index.build(tile_position)
+            i, j = tile.index.query_pairs_of(owned, radius)
+            tile_forces = self.rules(
+                tile_position, velocity[members], i, j, avoid_radius, view_radius
+            )
+            for force, tile_force in zip(forces, tile_forces):
+                force[members[owned]] = tile_force[owned]
+            return tile
+
+        lower, upper = self.tile_bounds(position, radius)
+        self.tiles = list(self.pool.map(compute_tile, lower, upper))
+        return tuple(forces)
+
+    def tile_bounds(
+        self, position: np.ndarray, radius: float
+    ) -> tuple[list[np.ndarray], list[np.ndarray]]:
+        """Lower and upper bounds of each tile, over the first two axes."""
+        shape = tile_shape(self.workers, np.ptp(position[:, :2], axis=0), radius)
+        lower, upper = [], []
+        for x_lo, x_hi in quantile_ranges(position[:, 0], shape[0]):
+            column = position[(position[:, 0] >= x_lo) & (position[:, 0] < x_hi), 1]
+            for y_lo, y_hi in quantile_ranges(column, shape[1]):
+                lower.append(np.array([x_lo, y_lo]))
+                upper.append(np.array([x_hi, y_hi]))
+        return lower, upper
+
+    def query_points(
+        self, position: np.ndarray, points: np.ndarray, radius: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Find all boids within radius of each of the given points.
+
+        Uses the indexes built by the last call, so must be called after it, before
+        the positions change. Points are looked up in every tile, keeping only the
+        boids which each tile owns.
+        """
+        point_index, boid_index = [], []
+        for tile in self.tiles:
+            p, b = tile.index.query_points(points, radius)
+            keep = tile.owned[b]
+            point_index.append(p[keep])
+            boid_index.append(tile.members[b[keep]])
+        return np.concatenate(point_index), np.concatenate(boid_index)
+
+
+def tile_shape(n_tiles: int, extent: np.ndarray, radius: float) -> tuple[int, int]:
+    """Number of tiles along each of two axes, to make about n_tiles in total.
+
+    Tiles are made as close to square (in number) as possible, but no narrower on
+    average than radius along either axis, beyond which the halos would dominate.
+    """
+    max_shape = np.maximum(1, extent // max(radius, 1e-9)).astype(int).tolist()
+    nx = min(math.ceil(math.sqrt(n_tiles)), max_shape[0])
+    ny = min(math.ceil(n_tiles / nx), max_shape[1])
+    # Use any spare tiles along the first axis, if the second is capped
+    nx = min(max(nx, math.ceil(n_tiles / ny)), max_shape[0])
+    return nx, ny
+
+
+def quantile_ranges(values: np.ndarray, n: int) -> list[tuple[float, float]]:
+    """Split the real line into n ranges, with similar numbers of values in each."""
+    if n == 1 or len(values) == 0:
+        return [(-np.inf, np.inf)]
+    edges = np.quantile(values, np.linspace(0, 1, n + 1)[1:-1])
+    return list(zip([-np.inf, *edges], [*edges, np.inf]))
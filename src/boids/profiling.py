@@ -0,0 +1,145 @@
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+
+class PhaseTimer:
+    """Accumulates the wall-clock time spent in named phases of a simulation.
+
+    Assign an instance to Flock.profiler to time the phases of each update. When no
+    profiler is assigned, Flock uses NO_PROFILER, whose phases do nothing. Further
+    instrumentation which costs more than a timer (e.g. neighbor-count histograms)
+    is only computed when the profiler is enabled.
+
+    Besides phase timings, the profiler keeps named counters, and histograms of
+    non-negative integer values (bin k counts occurrences of the value k).
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.total = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.histograms = {}
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] += n
+
+    def histogram(self, name: str, values: np.ndarray):
+        """Add integer values to the named histogram."""
+        counts = np.bincount(values)
+        total = self.histograms.get(name, np.zeros(0, dtype=np.int64))
+        if len(counts) > len(total):
+            total = np.pad(total, (0, len(counts) - len(total)))
+        total[: len(counts)] += counts
+        self.histograms[name] = total
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.total[name] += time.perf_counter() - start
+            self.calls[name] += 1
+
+    def summary(self) -> dict[str, dict[str, float]]:
+        """Total seconds, number of calls and mean milliseconds per call, by phase."""
+        return {
+            name: {
+                "total_s": total,
+                "calls": self.calls[name],
+                "mean_ms": 1000 * total / self.calls[name],
+            }
+            for name, total in self.total.items()
+        }
+
+    def report(self) -> str:
+        """Human-readable summary of the phases, counters and histograms."""
+        lines = [
+            f"{name:>12}: {stats['mean_ms']:8.3f} ms x {stats['calls']}"
+            for name, stats in self.summary().items()
+        ]
+        lines += [f"{name:>12}: {value}" for name, value in self.counters.items()]
+        for name, counts in self.histograms.items():
+            values = np.arange(len(counts))
+            mean = (values * counts).sum() / max(1, counts.sum())
+            lines.append(f"{name:>12}: mean {mean:.1f}, max {len(counts) - 1}")
+        return "\n".join(lines)
+
+
+class NullTimer:
+    """Stand-in for PhaseTimer which records nothing."""
+
+    enabled = False
+    context = nullcontext()
+
+    def phase(self, name: str):
+        return self.context
+
+    def count(self, name: str, n: int = 1):
+        pass
+
+    def histogram(self, name: str, values: np.ndarray):
+        pass
+
+
+class FrameStats:
+    """Smoothed timings of an animation, for display in a performance overlay.
+
+    Times are exponential moving averages, in milliseconds. fps is the achieved
+    framerate, measured between successive calls to tick(). Totals over all frames
+    are also kept, for report().
+    """
+
+    def __init__(self, smoothing: float = 0.1):
+        self.smoothing = smoothing
+        self.sim_ms = 0.0
+        self.render_ms = 0.0
+        self.fps = 0.0
+        self.last_tick = None
+        self.first_tick = None
+        self.frames = 0
+        self.render_total = 0.0
+        self.render_max = 0.0
+
+    def average(self, current: float, value: float) -> float:
+        return current + self.smoothing * (value - current)
+
+    def record_sim(self, seconds: float):
+        self.sim_ms = self.average(self.sim_ms, 1000 * seconds)
+
+    def record_render(self, seconds: float):
+        self.render_ms = self.average(self.render_ms, 1000 * seconds)
+        self.frames += 1
+        self.render_total += seconds
+        self.render_max = max(self.render_max, seconds)
+
+    def tick(self):
+        now = time.perf_counter()
+        if self.last_tick is not None and now > self.last_tick:
+            self.fps = self.average(self.fps, 1 / (now - self.last_tick))
+        else:
+            self.first_tick = now
+        self.last_tick = now
+
+    def report(self) -> str:
+        """Human-readable summary of the frame times over the whole animation."""
+        if self.frames == 0:
+            return "No frames rendered"
+        elapsed = self.last_tick - self.first_tick
+        return (
+            f"Rendered {self.frames} frames: "
+            f"{1000 * self.render_total / self.frames:.1f} ms/frame mean, "
+            f"{1000 * self.render_max:.1f} ms max, "
+            f"{(self.frames - 1) / max(elapsed, 1e-9):.1f} FPS achieved"
+        )
+
+
+NO_PROFILER = NullTimer()
@@ -0,0 +1,235 @@
+import json
+import warnings
+from pathlib import Path
+
+import numpy as np
+
+from .model import Flock
+
+FIELDS = ("position", "velocity", "predator_position", "predator_count")
+
+
+class TrajectoryRecorder:
+    """Streams the state of a flock to disk as it is simulated.
+
+    Frames are written into a directory of fixed-size chunks, each a preallocated
+    memory-mapped .npy file per field, so memory use is bounded by the chunk size
+    regardless of the length of the run. Floating-point state is downcast to dtype
+    (float32 by default). If compress is set, each chunk is rewritten as a compressed
+    .npz file once it is full; such chunks can no longer be memory-mapped, but are
+    still loaded one at a time.
+
+    The recorder records the current state on creation, then every `every`-th step.
+    Predators are recorded up to max_predators, with unused slots filled with NaN;
+    predator_count gives the number of predators in each frame. A flock which starts
+    with more predators is rejected, and one which gains more while recording raises
+    a warning, as only the first max_predators are kept.
+
+    Call close() when finished, to flush the final chunk and update the metadata.
+    Recordings are read with Trajectory.
+    """
+
+    def __init__(
+        self,
+        path: str | Path,
+        flock: Flock,
+        every: int = 1,
+        chunk_frames: int = 256,
+        dtype: np.dtype = np.float32,
+        compress: bool = False,
+        max_predators: int = 16,
+    ):
+        if len(flock.predator_position) > max_predators:
+            raise ValueError(
+                f"Flock has {len(flock.predator_position)} predators, more than "
+                f"max_predators ({max_predators})."
+            )
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.flock = flock
+        self.every = every
+        self.chunk_frames = chunk_frames
+        self.dtype = np.dtype(dtype)
+        self.compress = compress
+        self.max_predators = max_predators
+        self.n_frames = 0
+        self.chunk = None
+        self.warned_predators = False
+
+        self.write_metadata()
+        self.record(flock)
+        flock.observers.append(self)
+
+    def __call__(self, flock: Flock):
+        if flock.iteration % self.every == 0:
+            self.record(flock)
+
+    def record(self, flock: Flock):
+        """Write the current state of the flock as the next frame."""
+        frame = self.n_frames % self.chunk_frames
+        if frame == 0:
+            self.next_chunk()
+
+        n_predators = len(flock.predator_position)
+        if n_predators > self.max_predators and not self.warned_predators:
+            warnings.warn(
+                f"Flock has {n_predators} predators, only the first "
+                f"{self.max_predators} are recorded (see max_predators, or "
+                "--max-predators)."
+            )
+            self.warned_predators = True
+        n_predators = min(n_predators, self.max_predators)
+
+        self.chunk["position"][frame] = flock.position
+        self.chunk["velocity"][frame] = flock.velocity
+        self.chunk["predator_position"][frame, :n_predators] = flock.predator_position[
+            :n_predators
+        ]
+        self.chunk["predator_position"][frame, n_predators:] = np.nan
+        self.chunk["predator_count"][frame] = n_predators
+        self.n_frames += 1
+
+    def next_chunk(self):
+        """Finish the current chunk (if any), and preallocate the next."""
+        self.finish_chunk()
+        index = self.n_frames // self.chunk_frames
+        n_boids, ndim = self.flock.position.shape
+        shapes = {
+            "position": ((n_boids, ndim), self.dtype),
+            "velocity": ((n_boids, ndim), self.dtype),
+            "predator_position": ((self.max_predators, ndim), self.dtype),
+            "predator_count": ((), np.int32),
+        }
+        self.chunk = {
+            field: np.lib.format.open_memmap(
+                chunk_path(self.path, field, index, ".npy"),
+                mode="w+",
+                dtype=dtype,
+                shape=(self.chunk_frames, *shape),
+            )
+            for field, (shape, dtype) in shapes.items()
+        }
+
+    def finish_chunk(self):
+        """Flush the current chunk to disk, compressing it if configured."""
+        if self.chunk is None:
+            return
+        index = (self.n_frames - 1) // self.chunk_frames
+        n_written = self.n_frames - index * self.chunk_frames
+        for field, data in self.chunk.items():
+            data.flush()
+            if self.compress:
+                np.savez_compressed(
+                    chunk_path(self.path, field, index, ".npz"), data=data[:n_written]
+                )
+        self.chunk = None
+        if self.compress:
+            for field in FIELDS:
+                chunk_path(self.path, field, index, ".npy").unlink()
+        self.write_metadata()
+
+    def write_metadata(self):
+        metadata = {
+            "n_frames": self.n_frames,
+            "every": self.every,
+            "chunk_frames": self.chunk_frames,
+            "compress": self.compress,
+            "n_boids": len(self.flock),
+            "ndim": self.flock.ndim,
+            "bounds": self.flock.bounds.tolist(),
+            "max_predators": self.max_predators,
+        }
+        with open(self.path / "metadata.json", "w") as f:
+            json.dump(metadata, f, indent=2)
+
+    def close(self):
+        """Flush remaining frames, and stop recording the flock."""
+        self.finish_chunk()
+        if self in self.flock.observers:
+            self.flock.observers.remove(self)
+
+
+class Trajectory:
+    """A recording written by TrajectoryRecorder.
+
+    Each field (position, velocity, predator_position, predator_count) is a
+    ChunkedArray with time as the first axis, which loads chunks on demand. For
+    example, trajectory.position[100:200, :50] gives the first 50 boids over 100
+    frames. Slices within a single uncompressed chunk are memory-mapped views.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        with open(self.path / "metadata.json") as f:
+            self.metadata = json.load(f)
+        self.ndim = self.metadata["ndim"]
+        self.bounds = np.array(self.metadata["bounds"])
+        for field in FIELDS:
+            setattr(self, field, ChunkedArray(self.path, field, self.metadata))
+
+    def __len__(self) -> int:
+        return self.metadata["n_frames"]
+
+
+class ChunkedArray:
+    """Read-only array stored as a sequence of chunks along its first axis."""
+
+    def __init__(self, path: Path, field: str, metadata: dict):
+        self.path = path
+        self.field = field
+        self.n_frames = metadata["n_frames"]
+        self.chunk_frames = metadata["chunk_frames"]
+        self.chunks = {}
+        self.shape = (self.n_frames, *self.chunk(0).shape[1:])
+
+    def __len__(self) -> int:
+        return self.n_frames
+
+    def __getitem__(self, key):
+        time_key, rest = (key[0], key[1:]) if isinstance(key, tuple) else (key, ())
+        if not isinstance(time_key, slice):
+            if not -self.n_frames <= time_key < self.n_frames:
+                raise IndexError(f"Frame {time_key} out of range ({self.n_frames}).")
+            chunk, frame = divmod(time_key % self.n_frames, self.chunk_frames)
+            return self.chunk(chunk)[(frame, *rest)]
+
+        start, stop, step = time_key.indices(self.n_frames)
+        if step < 0:
+            raise IndexError("Negative steps are not supported.")
+        parts = []
+        for chunk in range(start // self.chunk_frames, self.n_chunks):
+            offset = chunk * self.chunk_frames
+            if offset >= stop:
+                break
+            # First frame in this chunk which lies on the step
+            first = max(start, offset)
+            first += (start - first) % step
+            local = slice(
+                first - offset, min(stop, offset + self.chunk_frames) - offset
+            )
+            parts.append(
+                self.chunk(chunk)[(slice(local.start, local.stop, step), *rest)]
+            )
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+    @property
+    def n_chunks(self) -> int:
+        return -(-self.n_frames // self.chunk_frames)
+
+    def chunk(self, index: int) -> np.ndarray:
+        """Memory-map a single chunk, or load it if compressed."""
+        if index not in self.chunks:
+            path = chunk_path(self.path, self.field, index, ".npy")
+            if path.exists():
+                self.chunks[index] = np.load(path, mmap_mode="r")
+            else:
+                # Only the most recently used compressed chunk is kept in memory
+                path = chunk_path(self.path, self.field, index, ".npz")
+                self.chunks = {index: np.load(path)["data"]}
+        return self.chunks[index]
+
+
+def chunk_path(path: Path, field: str, index: int, suffix: str) -> Path:
+    return path / f"{field}_{index:05d}{suffix}"
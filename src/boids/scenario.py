@@ -0,0 +1,172 @@
+import dataclasses
+import json
+import secrets
+import tomllib
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from .model import Flock, Weights
+
+
+@dataclass
+class Scenario:
+    """A reproducible description of a flock: its environment, parameters and seed.
+
+    Scenarios are usually loaded from a TOML or JSON file with load_scenario, whose
+    keys are the fields below. weights is a table of Weights fields, and options a
+    table of any other Flock arguments (e.g. neighbor_index or boundary).
+
+    predator_schedule lists [step, change] pairs: after the given step, change
+    predators are added (or, if negative, the oldest are removed). Changes at step 0
+    are made as the flock is created.
+
+    Random states are drawn from streams spawned from np.random.SeedSequence(seed),
+    rather than one shared generator. Each ensemble member gets its own child
+    sequence (see seed_sequence), and within a flock, boids and predators each get
+    their own stream (see Flock), so any member can be reproduced bit-for-bit on its
+    own, whatever other members are run alongside it and in whatever order. If seed
+    is None, fresh entropy is chosen and stored in seed when a flock is first made,
+    so that the run can be repeated.
+    """
+
+    n_boids: int
+    n_predators: int = 0
+    bounds: list[int] = field(default_factory=lambda: [1024, 1024, 1024])
+    barrier_pct: float = 5
+    min_speed: float = 130
+    max_speed: float = 170
+    predator_min_speed: float = 260
+    predator_max_speed: float = 350
+    view_radius: float = 150
+    avoid_radius: float = 20
+    weights: Weights = field(default_factory=Weights)
+    seed: int | None = None
+    predator_schedule: list[tuple[int, int]] = field(default_factory=list)
+    options: dict = field(default_factory=dict)
+
+    def seed_sequence(self, member: int | None = None) -> np.random.SeedSequence:
+        """The seed sequence of the scenario, or of one member of an ensemble of it.
+
+        Member k's sequence is the k-th child that SeedSequence(seed).spawn would
+        give, but is constructed directly, so members can be created independently
+        (e.g. in different processes).
+        """
+        if self.seed is None:
+            # Small enough to be written back to a TOML file
+            self.seed = secrets.randbits(63)
+        if member is None:
+            return np.random.SeedSequence(self.seed)
+        return np.random.SeedSequence(self.seed, spawn_key=(member,))
+
+    def flock_kwargs(self, member: int | None = None, **options) -> dict:
+        """Flock arguments for the scenario (or one member of an ensemble of it).
+
+        Keyword arguments are further Flock options, overridden by the scenario's
+        own options.
+        """
+        return (
+            {
+                "n_boids": self.n_boids,
+                "n_predators": self.n_predators,
+                "bounds": list(self.bounds),
+                "barrier_pct": self.barrier_pct,
+                "min_speed": self.min_speed,
+                "max_speed": self.max_speed,
+                "predator_min_speed": self.predator_min_speed,
+                "predator_max_speed": self.predator_max_speed,
+                "view_radius": self.view_radius,
+                "avoid_radius": self.avoid_radius,
+                "weights": dataclasses.replace(self.weights),
+                "seed_sequence": self.seed_sequence(member),
+            }
+            | options
+            | self.options
+        )
+
+    def ensemble(self, members: Iterable[int], **options) -> list[dict]:
+        """Flock arguments for the given members of an ensemble, as for run_ensemble.
+
+        A sweep can be sharded by giving each shard its own range of members; the
+        results do not depend on how members are split between shards or workers.
+        Ensembles cannot have predators, so neither can the scenario.
+        """
+        if self.n_predators or self.predator_schedule:
+            raise ValueError("Ensembles of a scenario cannot have predators.")
+        return [self.flock_kwargs(member, **options) for member in members]
+
+    def make_flock(self, member: int | None = None, **options) -> Flock:
+        """Create the scenario's flock, following its predator schedule if it has one.
+
+        Keyword arguments are as for flock_kwargs.
+        """
+        flock = Flock(**self.flock_kwargs(member, **options))
+        schedule = self.follow_schedule(flock)
+        if schedule is not None:
+            # Observers only run after an update, so step 0 is applied here
+            schedule(flock)
+        return flock
+
+    def follow_schedule(self, flock: Flock) -> "PredatorSchedule | None":
+        """Apply the predator schedule to a flock, e.g. one restored from a checkpoint.
+
+        Returns the schedule's observer, or None without a schedule.
+        """
+        if self.predator_schedule:
+            return PredatorSchedule(self.predator_schedule, flock)
+        return None
+
+    def to_dict(self) -> dict:
+        """The scenario as JSON-serialisable data, as read by load_scenario."""
+        return dataclasses.asdict(self)
+
+
+class PredatorSchedule:
+    """Adds and removes predators at given steps of a flock's simulation.
+
+    The schedule is a list of (step, change) pairs, as for Scenario.
+    """
+
+    def __init__(self, schedule: list[tuple[int, int]], flock: Flock):
+        self.changes = {}
+        for step, change in schedule:
+            self.changes[step] = self.changes.get(step, 0) + change
+        flock.observers.append(self)
+
+    def __call__(self, flock: Flock):
+        change = self.changes.get(flock.iteration, 0)
+        for _ in range(change):
+            flock.add_predator()
+        for _ in range(-change):
+            flock.remove_oldest_predator()
+
+
+def load_scenario(path: str | Path) -> Scenario:
+    """Read a scenario from a .toml or .json file."""
+    path = Path(path)
+    if path.suffix == ".toml":
+        with open(path, "rb") as f:
+            data = tomllib.load(f)
+    elif path.suffix == ".json":
+        with open(path) as f:
+            data = json.load(f)
+    else:
+        raise ValueError(
+            f"Unknown scenario format {path.suffix!r}, expected .toml or .json."
+        )
+
+    fields = {f.name for f in dataclasses.fields(Scenario)}
+    unknown = set(data) - fields
+    if unknown:
+        raise ValueError(f"Unknown scenario fields {sorted(unknown)}.")
+    if "weights" in data:
+        data["weights"] = Weights(**data["weights"])
+    if "predator_schedule" in data:
+        data["predator_schedule"] = [
+            (int(step), int(change)) for step, change in data["predator_schedule"]
+        ]
+        if any(step < 0 for step, _ in data["predator_schedule"]):
+            raise ValueError("Predator schedule steps must not be negative.")
+    return Scenario(**data)
@@ -0,0 +1,23 @@
+import time
+from collections.abc import Callable
+
+from .model import Flock
+
+
+def simulate(
+    flock: Flock,
+    n_steps: int,
+    step_size: float = 1 / 30,
+    callback: Callable[[Flock, int], None] | None = None,
+) -> float:
+    """Advance a flock a number of steps as fast as possible, without rendering.
+
+    The optional callback is called with the flock and the step number after each
+    step. Returns the elapsed wall-clock time in seconds.
+    """
+    start = time.perf_counter()
+    for step in range(n_steps):
+        flock.update(step_size)
+        if callback is not None:
+            callback(flock, step)
+    return time.perf_counter() - start
@@ -0,0 +1,61 @@
+import numpy as np
+
+from .neighbors import KDTreeIndex, minimum_image
+
+
+class TopologicalRules:
+    """Evaluates the flocking rules over each boid's k nearest neighbors.
+
+    Each boid aligns with and coheres to its k nearest boids however far away they
+    are, rather than every boid within the view radius, so the cost of a step does
+    not depend on the density of the flock. Avoidance still only applies to those
+    within the avoidance radius. If box is given, space is periodic with that size.
+    """
+
+    def __init__(self, k: int, box: np.ndarray | None = None, workers: int = 1):
+        if k < 1:
+            raise ValueError("The number of nearest neighbors must be at least 1.")
+        self.k = k
+        self.box = box
+        self.workers = workers
+        self.index = KDTreeIndex(box)
+
+    def __call__(
+        self,
+        position: np.ndarray,
+        velocity: np.ndarray,
+        avoid_radius: float,
+        view_radius: float,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Compute (avoidance, alignment, cohesion), as for flocking_rules.
+
+        view_radius is not used, as neighbors are chosen by rank rather than
+        distance.
+        """
+        # The tree may keep a reference to the positions, which Flock updates in-place
+        self.index.build(position.copy())
+        k = min(self.k, len(position) - 1)
+        if k < 1:
+            zeros = np.zeros(position.shape, dtype=np.float64)
+            return zeros, zeros.copy(), zeros.copy()
+
+        # The nearest point to each boid is itself, so query one more and drop it
+        distance, neighbor = self.index.tree.query(
+            position, k=k + 1, workers=self.workers
+        )
+        distance, neighbor = distance[:, 1:], neighbor[:, 1:]
+
+        offset = np.subtract(position[:, None], position[neighbor], dtype=np.float64)
+        if self.box is not None:
+            minimum_image(offset, self.box)
+        close = distance <= avoid_radius
+        avoidance = np.einsum("ij,ijk->ik", close, offset)
+        alignment = velocity[neighbor].mean(axis=1, dtype=np.float64) - velocity
+        cohesion = -offset.mean(axis=1)
+        return avoidance, alignment, cohesion
+
+    def query_points(
+        self, position: np.ndarray, points: np.ndarray, radius: float
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Find boids within radius of each point, in the tree from the last call."""
+        return self.index.query_points(points, radius)
@@ -0,0 +1,101 @@
+import queue
+import threading
+import time
+from collections.abc import Callable
+
+import numpy as np
+
+from .model import Flock
+
+
+class FrameBuffer:
+    """Triple buffer passing boid positions from the simulation to the renderer.
+
+    The writer fills whichever slot is neither the latest frame nor the one being
+    read, then marks it as the latest. The reader always gets the latest complete
+    frame, which is not modified until the reader asks for another.
+    """
+
+    def __init__(self, n_boids: int, ndim: int):
+        self.position = [np.zeros((n_boids, ndim)) for _ in range(3)]
+        self.predator_position = [np.zeros((0, ndim)) for _ in range(3)]
+        self.iteration = [0, 0, 0]
+        self.latest = 0
+        self.reading = 0
+        self.lock = threading.Lock()
+
+    def write(self, flock: Flock):
+        with self.lock:
+            slot = next(i for i in range(3) if i not in (self.latest, self.reading))
+        np.copyto(self.position[slot], flock.position)
+        self.predator_position[slot] = flock.predator_position.copy()
+        self.iteration[slot] = flock.iteration
+        with self.lock:
+            self.latest = slot
+
+    def read(self) -> tuple[int, np.ndarray, np.ndarray]:
+        """The latest frame, as (iteration, position, predator_position)."""
+        with self.lock:
+            self.reading = self.latest
+        slot = self.reading
+        return self.iteration[slot], self.position[slot], self.predator_position[slot]
+
+
+class SimulationWorker:
+    """Advances a flock in a background thread, independently of rendering.
+
+    The worker steps the flock in real time: each step advances the simulation by
+    step_size seconds, and the worker sleeps if it gets ahead of the wall clock. If
+    steps take longer than step_size, the simulation runs slower than real time
+    instead. Each completed step is published to self.frames. The achieved step
+    rate, and the time taken by each step, are tracked as moving averages.
+
+    Other threads must not modify the flock directly while the worker is running.
+    Changes are instead submitted as callables taking the flock, which are applied
+    between steps.
+    """
+
+    def __init__(self, flock: Flock, step_size: float):
+        self.flock = flock
+        self.step_size = step_size
+        self.frames = FrameBuffer(len(flock), flock.ndim)
+        self.frames.write(flock)
+        self.commands = queue.SimpleQueue()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.steps_per_second = 0.0
+        self.step_ms = 0.0
+
+    def submit(self, command: Callable[[Flock], None]):
+        """Queue a change to the flock, applied before the next step."""
+        self.commands.put(command)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def run(self):
+        next_step = previous_step = time.perf_counter()
+        while not self.stopped.is_set():
+            while not self.commands.empty():
+                self.commands.get()(self.flock)
+
+            start = time.perf_counter()
+            self.flock.update(self.step_size)
+            self.frames.write(self.flock)
+            now = time.perf_counter()
+            # Exponential moving averages of the step time and achieved step rate
+            self.step_ms += 0.1 * (1000 * (now - start) - self.step_ms)
+            rate = 1 / max(now - previous_step, 1e-9)
+            self.steps_per_second += 0.1 * (rate - self.steps_per_second)
+            previous_step = now
+
+            next_step += self.step_size
+            if next_step > now:
+                time.sleep(next_step - now)
+            else:
+                # Running behind real time, so don't try to catch up
+                next_step = now
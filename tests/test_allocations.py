@@ -0,0 +1,95 @@
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from boids.model import Flock, bound_norm
+
+# Small, fixed allocations (e.g. ufunc call overhead) are allowed, but nothing that
+# grows with the number of boids
+ALLOWED_BYTES = 16 * 1024
+
+
+def peak_allocation(func) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_bound_norm_leaves_zero_rows():
+    vec = np.array([[0.0, 0.0], [3.0, 4.0], [0.3, 0.4]])
+    bound_norm(vec, 1, 2)
+    np.testing.assert_allclose(vec, [[0, 0], [1.2, 1.6], [0.6, 0.8]])
+
+
+def test_zero_initial_velocity():
+    flock = Flock(20, min_speed=0, initial_velocity=np.zeros((20, 2)), random_seed=0)
+    for _ in range(5):
+        flock.update(1 / 30)
+    assert np.isfinite(flock.position).all()
+    assert np.isfinite(flock.velocity).all()
+
+
+@pytest.mark.parametrize("n_boids", [1000, 10000])
+def test_cached_steps_do_not_allocate(n_boids):
+    flock = Flock(
+        n_boids,
+        bounds=[1024] * 3,
+        view_radius=50,
+        avoid_radius=20,
+        force_interval=4,
+        random_seed=0,
+    )
+    # Warm up the workspace, then skip to the first step that reuses the rules
+    for _ in range(8):
+        flock.update(1 / 30)
+    for _ in range(3):
+        assert peak_allocation(lambda: flock.update(1 / 30)) < ALLOWED_BYTES
+
+
+@pytest.mark.parametrize("n_predators", [0, 5])
+@pytest.mark.parametrize("n_boids", [1000, 10000])
+def test_full_steps_only_allocate_for_rules(n_boids, n_predators):
+    flock = Flock(
+        n_boids,
+        bounds=[1024] * 3,
+        view_radius=50,
+        avoid_radius=20,
+        n_predators=n_predators,
+        random_seed=0,
+    )
+    for _ in range(3):
+        flock.update(1 / 30)
+    for _ in range(3):
+        step_bytes = peak_allocation(lambda: flock.update(1 / 30))
+        # The rules are recomputed from the positions the step left, so find the
+        # same pairs
+        rules_bytes = peak_allocation(flock.apply_rules)
+        assert step_bytes < rules_bytes + ALLOWED_BYTES
+        if n_predators:
+            flee = peak_allocation(lambda: flock.flee_predators(flock.neighbors))
+            assert flee < ALLOWED_BYTES
+
+
+@pytest.mark.parametrize("boundary", ["walls", "periodic"])
+@pytest.mark.parametrize("n_boids", [1000, 10000])
+def test_cached_steps_with_predators(n_boids, boundary):
+    flock = Flock(
+        n_boids,
+        bounds=[1024] * 3,
+        view_radius=50,
+        avoid_radius=20,
+        n_predators=5,
+        boundary=boundary,
+        force_interval=4,
+        random_seed=0,
+    )
+    for _ in range(8):
+        flock.update(1 / 30)
+    for _ in range(3):
+        step_bytes = peak_allocation(lambda: flock.update(1 / 30))
+        index_bytes = peak_allocation(lambda: flock.flee_index.build(flock.position))
+        assert step_bytes < index_bytes + ALLOWED_BYTES
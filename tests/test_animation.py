@@ -0,0 +1,41 @@
+import time
+
+import matplotlib
+import matplotlib.pyplot as plt
+import pytest
+
+from boids.animation import PlaybackAnimation
+from boids.model import Flock
+from boids.recording import Trajectory, TrajectoryRecorder
+
+matplotlib.use("Agg")
+
+
+@pytest.mark.parametrize("ndim", [2, 3])
+def test_seek_slider_follows_playback(tmp_path, ndim):
+    flock = Flock(100, n_predators=1, bounds=[1024] * ndim, random_seed=0)
+    recorder = TrajectoryRecorder(tmp_path / "run", flock)
+    for _ in range(20):
+        flock.update(1 / 30)
+    recorder.close()
+
+    playback = PlaybackAnimation(Trajectory(tmp_path / "run"))
+    seeks = []
+    playback.seek_slider.on_changed(seeks.append)
+    playback.prefetcher.start()
+    try:
+        time.sleep(0.2)
+        for k in range(5):
+            playback.update_plot(k)
+        assert playback.seek_slider.val == playback.frame > 0
+        # Following playback must not seek
+        assert seeks == []
+
+        playback.seek_slider.set_val(12)
+        time.sleep(0.1)
+        playback.update_plot(0)
+        assert seeks == [12]
+        assert playback.seek_slider.val == playback.frame == 12
+    finally:
+        playback.prefetcher.stop()
+        plt.close(playback.fig)
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from boids.model import Flock, flocking_rules
+from boids.neighbors import KDTreeIndex
+
+compiled = pytest.importorskip("boids.compiled")
+if not compiled.AVAILABLE:
+    pytest.skip("numba is not installed", allow_module_level=True)
+
+
+def random_state(n_boids: int, ndim: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    bounds = np.array([0] * ndim + [1024] * ndim)
+    position = rng.random((n_boids, ndim)) * 1024
+    velocity = rng.normal(size=(n_boids, ndim)) * 150
+    return bounds, position, velocity
+
+
+def reference_rules(position, velocity, avoid_radius, view_radius):
+    index = KDTreeIndex()
+    index.build(position)
+    return flocking_rules(
+        position,
+        velocity,
+        *index.query_pairs(max(avoid_radius, view_radius)),
+        avoid_radius,
+        view_radius,
+    )
+
+
+@pytest.mark.parametrize("ndim", [2, 3])
+@pytest.mark.parametrize("radii", [(20, 150), (20, 50), (60, 40)])
+def test_rules_match_numpy(ndim, radii):
+    bounds, position, velocity = random_state(2000, ndim)
+    expected = reference_rules(position, velocity, *radii)
+    forces = compiled.CompiledRules(bounds)(position, velocity, *radii)
+    for force, reference in zip(forces, expected):
+        np.testing.assert_allclose(force, reference, rtol=1e-9, atol=1e-9)
+
+
+def test_rules_outside_bounds():
+    # Boids outside the bounds are assigned to the edge cells
+    bounds, position, velocity = random_state(500, 2)
+    position[:50] -= 1100
+    expected = reference_rules(position, velocity, 20, 150)
+    forces = compiled.CompiledRules(bounds)(position, velocity, 20, 150)
+    for force, reference in zip(forces, expected):
+        np.testing.assert_allclose(force, reference, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("ndim", [2, 3])
+def test_query_points_match_kdtree(ndim):
+    bounds, position, velocity = random_state(2000, ndim)
+    points = np.random.default_rng(1).random((7, ndim)) * 1024
+    rules = compiled.CompiledRules(bounds)
+    rules(position, velocity, 20, 150)
+    found = rules.query_points(position, points, 150)
+
+    index = KDTreeIndex()
+    index.build(position)
+    expected = index.query_points(points, 150)
+    assert sorted(zip(*found)) == sorted(zip(*expected))
+
+
+def test_flock_matches_numpy_backend():
+    flocks = [
+        Flock(
+            1000,
+            n_predators=2,
+            bounds=[1024, 1024, 1024],
+            min_speed=130,
+            max_speed=170,
+            predator_min_speed=260,
+            predator_max_speed=350,
+            view_radius=150,
+            avoid_radius=20,
+            random_seed=0,
+            backend=backend,
+        )
+        for backend in ("numpy", "numba")
+    ]
+    assert flocks[1].backend == "numba"
+    for _ in range(10):
+        for flock in flocks:
+            flock.update(1 / 30)
+    np.testing.assert_allclose(flocks[1].state, flocks[0].state, rtol=0, atol=1e-6)
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from boids.ensemble import Ensemble, run_ensemble
+from boids.model import Flock
+from boids.scenario import Scenario
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"boundary": "periodic"},
+        {"n_nearest": 7},
+        {"force_interval": 2},
+        {"rebuild_interval": 2},
+        {"chunk_size": 10},
+        {"n_predators": 1},
+    ],
+)
+def test_rejects_unsupported_members(options):
+    flocks = [
+        Flock(50, view_radius=10, avoid_radius=5, random_seed=0),
+        Flock(50, view_radius=10, avoid_radius=5, random_seed=1, **options),
+    ]
+    with pytest.raises(ValueError, match="Ensemble members cannot"):
+        Ensemble(flocks)
+
+
+@pytest.mark.parametrize(
+    "predators", [{"n_predators": 1}, {"predator_schedule": [(10, 1)]}]
+)
+def test_scenario_ensemble_rejects_predators(predators):
+    with pytest.raises(ValueError, match="cannot have predators"):
+        Scenario(50, **predators).ensemble(range(2))
+
+
+def test_run_scenario_ensemble():
+    scenario = Scenario(50, bounds=[200, 200], view_radius=20, avoid_radius=5, seed=1)
+    summary = run_ensemble(scenario.ensemble(range(3)), n_steps=2)
+    assert summary["polarization"].shape == (3,)
+
+
+def test_summary_with_boids_at_rest():
+    flocks = [
+        Flock(20, min_speed=0, initial_velocity=velocity, random_seed=0)
+        for velocity in (np.zeros((20, 2)), np.tile([[100.0, 0]], (20, 1)))
+    ]
+    polarization = Ensemble(flocks).summary()["polarization"]
+    assert np.isnan(polarization[0])
+    assert polarization[1] == 1
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from boids.metrics import MetricsRecorder, read_metrics
+from boids.model import Flock
+from boids.neighbors import minimum_image
+
+
+def record_once(tmp_path, flock: Flock, metrics: tuple[str, ...]) -> np.ndarray:
+    recorder = MetricsRecorder(tmp_path / "metrics.bin", flock, metrics=metrics)
+    recorder.close()
+    return read_metrics(tmp_path / "metrics.bin")[1][-1]
+
+
+@pytest.mark.parametrize("boundary", ["walls", "periodic"])
+def test_predators_match_direct_distances(tmp_path, boundary):
+    flock = Flock(
+        2000,
+        n_predators=30,
+        bounds=[1000, 1000],
+        view_radius=50,
+        avoid_radius=20,
+        boundary=boundary,
+        random_seed=0,
+    )
+    record = record_once(tmp_path, flock, ("predators",))
+
+    offset = flock.position[None, :, :] - flock.predator_position[:, None, :]
+    if flock.box is not None:
+        minimum_image(offset, flock.box)
+    distance = np.linalg.norm(offset, axis=2)
+    nearest = distance.min(axis=1)
+    np.testing.assert_allclose(record["predator_nearest_min"], nearest.min(), rtol=1e-6)
+    np.testing.assert_allclose(
+        record["predator_nearest_mean"], nearest.mean(), rtol=1e-6
+    )
+    assert record["boids_near_predators"] == (distance <= 50).any(axis=0).sum()
+
+
+def test_polarization_ignores_boids_at_rest(tmp_path):
+    velocity = np.zeros((20, 2))
+    flock = Flock(20, min_speed=0, initial_velocity=velocity, random_seed=0)
+    assert np.isnan(record_once(tmp_path, flock, ("polarization",))["polarization"])
+
+    velocity[:10] = [100, 0]
+    flock = Flock(20, min_speed=0, initial_velocity=velocity, random_seed=0)
+    assert record_once(tmp_path, flock, ("polarization",))["polarization"] == 1
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from boids.model import Flock
+from boids.neighbors import minimum_image
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"neighbor_index": "grid", "view_radius": 400},
+        {"neighbor_index": "grid", "view_radius": 300, "skin": 50},
+        {"chunk_size": 100, "view_radius": 400},
+    ],
+)
+def test_periodic_grid_needs_three_cells(options):
+    with pytest.raises(ValueError, match="too large for periodic boundaries"):
+        Flock(200, bounds=[1024, 1024], boundary="periodic", **options)
+
+
+@pytest.mark.parametrize(
+    "options", [{"neighbor_index": "grid"}, {"chunk_size": 256}, {}]
+)
+def test_periodic_radius_checked_when_set(options):
+    flock = Flock(
+        200,
+        bounds=[1024, 1024, 1024],
+        boundary="periodic",
+        view_radius=100,
+        random_seed=0,
+        **options,
+    )
+    with pytest.raises(ValueError, match="too large for periodic boundaries"):
+        flock.view_radius = 600
+    with pytest.raises(ValueError, match="too large for periodic boundaries"):
+        flock.avoid_radius = 600
+    if options:
+        with pytest.raises(ValueError, match="too large for periodic boundaries"):
+            flock.view_radius = 400
+    assert flock.view_radius == 100
+    flock.view_radius = 300
+    flock.update()
+
+
+def test_periodic_grid_at_a_third():
+    flock = Flock(
+        200,
+        bounds=[1024, 1024],
+        boundary="periodic",
+        neighbor_index="grid",
+        view_radius=1024 / 3,
+        random_seed=0,
+    )
+    flock.update()
+
+
+@pytest.mark.parametrize("boundary", ["walls", "periodic"])
+def test_flee_without_rules_index(boundary):
+    flock = Flock(
+        2000,
+        n_predators=30,
+        bounds=[1000, 1000],
+        view_radius=50,
+        avoid_radius=20,
+        boundary=boundary,
+        random_seed=0,
+    )
+    flee = flock.flee_predators(None)
+
+    expected = np.zeros_like(flock.position)
+    for predator in flock.predator_position:
+        offset = flock.position - predator
+        if flock.box is not None:
+            minimum_image(offset, flock.box)
+        near = np.linalg.norm(offset, axis=1) <= flock.view_radius
+        direction = offset[near].sum(axis=0)
+        if near.any():
+            expected[near] += direction / np.linalg.norm(direction)
+    expected *= flock.weights.flee * flock.max_speed
+    np.testing.assert_allclose(flee, expected, atol=1e-9)
@@ -0,0 +1,28 @@
+import numpy as np
+
+from boids.benchmark import make_flock
+from boids.neighbors import GridIndex, KDTreeIndex
+
+
+def test_grid_reuses_wide_enough_cells():
+    rng = np.random.default_rng(0)
+    bounds = np.array([0, 0, 0, 1024, 1024, 1024])
+    position = rng.random((2000, 3)) * 1024
+    points = rng.random((20, 3)) * 1024
+    grid, tree = GridIndex(bounds), KDTreeIndex()
+    grid.build(position)
+    tree.build(position)
+    grid.query_pairs(50)
+    for radius in np.linspace(50, 80, 30):
+        found = set(zip(*grid.query_points(points, radius)))
+        assert found == set(zip(*tree.query_points(points, radius)))
+        assert len(grid.cell_lists) <= 2
+
+
+def test_lazy_rebuilds_keep_cache_bounded():
+    flock = make_flock(
+        5000, 3, 50, 20, 0, neighbor_index="grid", rebuild_interval=10, skin=10
+    )
+    for _ in range(50):
+        flock.update(1 / 30)
+        assert len(flock.neighbor_index.cell_lists) <= 2
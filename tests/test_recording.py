@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from boids.cli import run_simulate
+from boids.model import Flock
+from boids.recording import Trajectory, TrajectoryRecorder
+
+
+def test_rejects_too_many_predators(tmp_path):
+    flock = Flock(50, n_predators=3, random_seed=0)
+    with pytest.raises(ValueError, match="more than max_predators"):
+        TrajectoryRecorder(tmp_path / "run", flock, max_predators=2)
+
+
+def test_warns_when_predators_exceed_cap(tmp_path):
+    flock = Flock(50, n_predators=2, random_seed=0)
+    recorder = TrajectoryRecorder(tmp_path / "run", flock, max_predators=2)
+    flock.add_predator()
+    with pytest.warns(UserWarning, match="only the first 2 are recorded"):
+        flock.update(1 / 30)
+    recorder.close()
+    assert Trajectory(tmp_path / "run").predator_count[1] == 2
+
+
+def test_simulate_max_predators(tmp_path):
+    run_simulate(
+        [
+            "50",
+            "--predators",
+            "20",
+            "--steps",
+            "3",
+            "--record",
+            str(tmp_path / "run"),
+            "--max-predators",
+            "24",
+        ]
+    )
+    trajectory = Trajectory(tmp_path / "run")
+    assert np.all(trajectory.predator_count[:] == 20)
@@ -0,0 +1,21 @@
+import pytest
+
+from boids.scenario import Scenario, load_scenario
+
+
+def test_schedule_at_step_zero():
+    scenario = Scenario(
+        50, bounds=[200, 200], seed=0, predator_schedule=[(0, 2), (3, 1)]
+    )
+    flock = scenario.make_flock()
+    assert len(flock.predator_position) == 2
+    for _ in range(3):
+        flock.update(1 / 30)
+    assert len(flock.predator_position) == 3
+
+
+def test_negative_schedule_step(tmp_path):
+    path = tmp_path / "scenario.toml"
+    path.write_text("n_boids = 50\npredator_schedule = [[-1, 2]]\n")
+    with pytest.raises(ValueError, match="must not be negative"):
+        load_scenario(path)